@@ -0,0 +1,253 @@
+import io
+import os
+import queue
+import tempfile
+import threading
+import subprocess
+from typing import List, Optional
+
+# pydub may be missing; main.py reports the missing dependency before any helper is used
+try:
+    from pydub import AudioSegment
+except ImportError:
+    AudioSegment = None
+
+# NumPy is optional: mixing uses vectorized array math when available and falls
+# back to pydub's own overlay otherwise
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Sample widths (bytes) that can be mixed as NumPy integer arrays, with the
+# sample type and the narrowest type that holds the sum of two samples
+_NUMPY_SAMPLE_TYPES = {2: ("int16", "int32"), 4: ("int32", "int64")}
+
+# ffmpeg raw input formats matching pydub's in-memory sample layout, by sample width
+# (pydub stores 8-bit audio as signed samples, biased from unsigned WAV on load)
+_RAW_PCM_FORMATS = {1: "s8", 2: "s16le", 3: "s24le", 4: "s32le"}
+
+# LAME algorithm quality (0 = best/slowest, 9 = fastest). At a fixed bitrate 7
+# encodes about twice as fast as ffmpeg's default with little audible difference
+# for speech over background music
+MP3_COMPRESSION_LEVEL = 7
+
+def decode_wav(audio_content: bytes) -> Optional["AudioSegment"]:
+    """
+    Decodes generated WAV audio straight from memory.
+
+    pydub parses PCM WAV data itself, so no temp file or ffmpeg process is
+    involved. Failures are logged and None is returned.
+    """
+    try:
+        return AudioSegment.from_file(io.BytesIO(audio_content), format="wav")
+    except Exception as e:
+        print(f"    ERROR decoding audio ({len(audio_content)} bytes): {e}")
+        return None
+
+def concatenate_segments(segments: List["AudioSegment"]) -> "AudioSegment":
+    """
+    Joins audio segments end to end with a single copy of the sample data.
+
+    Appending with `+=` copies everything accumulated so far on every append.
+    Here all segments are converted to a common format once (as pydub does
+    when appending) and their raw data is joined in one pass. `bytes.join`
+    sizes the result up front and copies each segment into place once, so a
+    preallocated bytearray would only add a final copy back to bytes.
+    """
+    if not segments:
+        return AudioSegment.empty()
+    if len(segments) == 1:
+        return segments[0] # Segments are immutable, so no copy is needed
+    synced = AudioSegment._sync(*segments)
+    return synced[0]._spawn(b"".join(segment.raw_data for segment in synced))
+
+def overlay_with_gain(
+    base: "AudioSegment",
+    overlay: "AudioSegment",
+    gain_db: float,
+    loop: bool = False
+) -> "AudioSegment":
+    """
+    Mixes `overlay` into `base` after applying `gain_db` to the overlay.
+
+    Behaves like `base.overlay(overlay + gain_db, loop=loop)`: the result keeps
+    the length of `base` and samples are clipped to the valid range. With NumPy
+    the gain, sum and clip happen in one vectorized pass over the samples, and a
+    looped overlay is added slice by slice instead of being repeated into a
+    full-length copy first.
+
+    Args:
+        base: The segment to mix into (e.g. dialogue).
+        overlay: The segment laid on top (e.g. background music).
+        gain_db: Gain applied to the overlay in dB (negative to make it quieter).
+        loop: Repeat the overlay until it covers all of `base`.
+
+    Returns:
+        The mixed AudioSegment.
+    """
+    base, overlay = AudioSegment._sync(base, overlay)
+    sample_types = _NUMPY_SAMPLE_TYPES.get(base.sample_width)
+    if np is None or sample_types is None:
+        return base.overlay(overlay + gain_db, loop=loop)
+
+    sample_type, accumulator_type = sample_types
+    base_samples = np.frombuffer(base.raw_data, dtype=sample_type).astype(accumulator_type)
+    overlay_samples = np.frombuffer(overlay.raw_data, dtype=sample_type)[:len(base_samples)]
+    scale = 10 ** (gain_db / 20.0)
+
+    scaled_overlay = (overlay_samples * scale).astype(accumulator_type)
+    limits = np.iinfo(sample_type)
+    if scale > 1:
+        np.clip(scaled_overlay, limits.min, limits.max, out=scaled_overlay) # A boosted overlay clips on its own, as in pydub
+    starts = range(0, len(base_samples), len(scaled_overlay)) if loop and len(scaled_overlay) else [0]
+    for start in starts:
+        window = base_samples[start:start + len(scaled_overlay)] # A view, so += mixes in place
+        window += scaled_overlay[:len(window)]
+    np.clip(base_samples, limits.min, limits.max, out=base_samples) # In place, no extra full-length array
+    return base._spawn(base_samples.astype(sample_type).tobytes())
+
+def export_mp3(segment: "AudioSegment", filepath: str, bitrate: str = "128k") -> None:
+    """
+    Encodes a segment to MP3 by piping its raw PCM straight into ffmpeg.
+
+    Unlike `AudioSegment.export`, no intermediate WAV copy of the whole audio is
+    written to disk first. Raises an exception if encoding fails.
+
+    Args:
+        segment: The audio to encode.
+        filepath: Destination .mp3 path.
+        bitrate: MP3 bitrate passed to libmp3lame (e.g. "128k").
+    """
+    pcm_format = _RAW_PCM_FORMATS.get(segment.sample_width)
+    if pcm_format is None:
+        segment.export(filepath, format="mp3", bitrate=bitrate,
+                       parameters=["-compression_level", str(MP3_COMPRESSION_LEVEL)])
+        return
+
+    command = _mp3_encode_command(pcm_format, segment.frame_rate, segment.channels, bitrate, filepath)
+    process = subprocess.run(command, input=segment.raw_data, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        error_tail = process.stderr.decode("utf-8", errors="replace")[-500:]
+        raise RuntimeError(f"ffmpeg exited with code {process.returncode}: {error_tail}")
+
+def _mp3_encode_command(pcm_format: str, frame_rate: int, channels: int, bitrate: str, filepath: str) -> List[str]:
+    """Builds the ffmpeg command that encodes raw PCM read from stdin to an MP3 file."""
+    return [
+        AudioSegment.converter, "-y",
+        "-f", pcm_format,
+        "-ar", str(frame_rate),
+        "-ac", str(channels),
+        "-i", "pipe:0",
+        "-c:a", "libmp3lame",
+        "-b:a", bitrate,
+        "-compression_level", str(MP3_COMPRESSION_LEVEL),
+        filepath
+    ]
+
+class Mp3StreamWriter:
+    """
+    Encodes segments to one MP3 file as they are produced.
+
+    A background thread feeds queued segments into a single running ffmpeg
+    process, so encoding of earlier audio overlaps with producing later audio.
+    Assembly and encoding happen in that one ffmpeg pass, as with the concat
+    demuxer, but without writing each segment and a list file to disk first.
+    The output format is taken from the first segment; later segments are
+    converted to match. Call close() to finish the file, or abort() to discard it.
+    """
+
+    def __init__(self, filepath: str, bitrate: str = "128k", max_queued: int = 4):
+        self.filepath = filepath
+        self.bitrate = bitrate
+        self._queue = queue.Queue(maxsize=max_queued) # Bounds memory if ffmpeg falls behind
+        self._process = None
+        self._stderr = None
+        self._format = None # (frame_rate, channels, sample_width) of the output
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, segment: "AudioSegment") -> None:
+        """Queues a segment to be appended to the MP3."""
+        self._queue.put(segment)
+
+    def close(self) -> None:
+        """
+        Waits until all queued audio is encoded and ffmpeg has finished.
+
+        Raises:
+            RuntimeError: If nothing was written or ffmpeg failed.
+        """
+        self._queue.put(None)
+        self._thread.join()
+        if self._error is None and self._process is None:
+            self._error = RuntimeError("No audio was written")
+        if self._error is not None:
+            raise self._error
+
+    def abort(self) -> None:
+        """
+        Stops encoding and deletes the partly written MP3.
+
+        Does nothing once close() or abort() has returned.
+        """
+        if not self._thread.is_alive():
+            return
+        if self._error is None:
+            self._error = RuntimeError("Encoding was aborted") # Later queued segments are drained, not encoded
+        if self._process is not None:
+            self._process.kill()
+        self._queue.put(None)
+        self._thread.join()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def _run(self) -> None:
+        while True:
+            segment = self._queue.get()
+            if segment is None:
+                break
+            if self._error is not None:
+                continue # Keep draining so write() never blocks after a failure
+            try:
+                self._encode(segment)
+            except Exception as e:
+                self._error = e
+        if self._process is not None:
+            self._finish()
+
+    def _encode(self, segment: "AudioSegment") -> None:
+        if self._process is None:
+            if segment.sample_width not in _RAW_PCM_FORMATS:
+                segment = segment.set_sample_width(2)
+            self._format = (segment.frame_rate, segment.channels, segment.sample_width)
+            # stderr goes to a file rather than a pipe, which could fill up and stall ffmpeg
+            self._stderr = tempfile.TemporaryFile()
+            command = _mp3_encode_command(
+                _RAW_PCM_FORMATS[segment.sample_width], segment.frame_rate, segment.channels, self.bitrate, self.filepath
+            )
+            self._process = subprocess.Popen(
+                command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=self._stderr
+            )
+
+        frame_rate, channels, sample_width = self._format
+        if segment.frame_rate != frame_rate:
+            segment = segment.set_frame_rate(frame_rate)
+        if segment.channels != channels:
+            segment = segment.set_channels(channels)
+        if segment.sample_width != sample_width:
+            segment = segment.set_sample_width(sample_width)
+        self._process.stdin.write(segment.raw_data)
+
+    def _finish(self) -> None:
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass # ffmpeg already exited; its return code says why
+        returncode = self._process.wait()
+        if returncode != 0 and (self._error is None or isinstance(self._error, OSError)): # Prefer ffmpeg's message over a broken pipe
+            self._stderr.seek(0)
+            error_tail = self._stderr.read().decode("utf-8", errors="replace")[-500:]
+            self._error = RuntimeError(f"ffmpeg exited with code {returncode}: {error_tail}")
+        self._stderr.close()
@@ -1,7 +1,18 @@
 import os
+import copy
+import array
 import json
-from typing import Any, Dict, Optional
+import math
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from openai import OpenAI, OpenAIError # Use 'openai' package >= 1.0
+from file_cache import CACHE_ROOT
+from prompt import PromptBundle
 
 # --- Make sure to set your OpenAI API key ---
 # Best practice: Set as an environment variable `OPENAI_API_KEY`
@@ -9,52 +20,454 @@ from openai import OpenAI, OpenAIError # Use 'openai' package >= 1.0
 # Or uncomment and set directly (less secure):
 # os.environ["OPENAI_API_KEY"] = "your_api_key_here"
 
+# Retries for rate limits (429), server errors and dropped connections. The client
+# backs off exponentially with jitter and honors the Retry-After header.
+OPENAI_MAX_RETRIES = 5
+
 # Initialize OpenAI Client (expects OPENAI_API_KEY env var)
 try:
-    client = OpenAI()
+    client = OpenAI(max_retries=OPENAI_MAX_RETRIES)
 except OpenAIError as e:
     print(f"Error initializing OpenAI client: {e}")
     print("Please ensure the OPENAI_API_KEY environment variable is set.")
     client = None # Set client to None if initialization fails
 
-def get_audio_script_json(prompt_request: Dict[str, Any], model: str = "gpt-4o") -> Optional[Dict[str, Any]]:
+DEFAULT_TEMPERATURE = 0.7 # Adjust creativity (0.0 to 2.0)
+BATCH_POLL_INTERVAL_SECONDS = 30 # How often to check on a submitted Batch API job
+
+# --- Request Limits ---
+# OpenAI requests (chat completions and embeddings) in flight at once, and started
+# per second, across every caller in the process. Keeps concurrent callers under
+# the account's rate limits instead of relying on 429 retries.
+OPENAI_MAX_IN_FLIGHT = int(os.environ.get("MUSIC_GEN_MAX_INFLIGHT", "3"))
+OPENAI_MAX_REQUESTS_PER_SECOND = 5
+
+class _RateLimiter:
+    """Token bucket allowing `rate` acquisitions per second, in bursts of up to `rate`."""
+
+    def __init__(self, rate: float):
+        self._rate = rate
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Blocks until a request may start."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._rate, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self._rate
+            time.sleep(wait_seconds)
+
+_REQUEST_SLOTS = threading.BoundedSemaphore(OPENAI_MAX_IN_FLIGHT)
+_RATE_LIMITER = _RateLimiter(OPENAI_MAX_REQUESTS_PER_SECOND)
+
+def _limited_call(create: Callable[..., Any], **request_args) -> Any:
+    """Makes a (non-streaming) OpenAI API call within the process-wide request limits."""
+    with _REQUEST_SLOTS:
+        _RATE_LIMITER.acquire()
+        return create(**request_args)
+
+# --- Response Cache ---
+# Parsed responses are stored on disk keyed by a hash of the full request, so
+# re-running the same script (dev iteration, tests) skips the API round trip.
+# Set OPENAI_CACHE=0 to disable.
+OPENAI_CACHE_DIR = os.path.join(CACHE_ROOT, "openai")
+OPENAI_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60 # Cached responses expire after a week
+
+cache_enabled = os.environ.get("OPENAI_CACHE", "1") != "0"
+cache_stats = {"hits": 0, "misses": 0, "memory_hits": 0, "semantic_hits": 0}
+_cache_stats_lock = threading.Lock() # Requests may run on several threads at once
+
+def _count_cache_event(name: str) -> None:
+    """Increments one of the cache_stats counters."""
+    with _cache_stats_lock:
+        cache_stats[name] += 1
+
+# Deterministic (temperature 0) responses are also kept in memory, so repeating a
+# request within one process skips the disk read. Sampled responses are only
+# cached on disk, where they can be cleared between runs.
+RESPONSE_MEMO_MAX_ENTRIES = 64
+_response_memo: "OrderedDict[str, Dict[str, Any]]" = OrderedDict() # Cache key -> response, least recently used first
+_response_memo_lock = threading.Lock()
+
+# --- Semantic Cache (opt-in) ---
+# Scripts that only differ in theme/mood/age share most of their structure and
+# never hit the exact-match cache. When enabled, the user prompt is embedded and
+# a stored response is reused if a previous prompt is similar enough.
+# Set SEMANTIC_CACHE=1 to enable (OPENAI_CACHE=0 disables it as well).
+semantic_cache_enabled = os.environ.get("SEMANTIC_CACHE") == "1"
+SEMANTIC_CACHE_PATH = os.path.join(OPENAI_CACHE_DIR, "semantic_index.sqlite3") # Entries expire with OPENAI_CACHE_TTL_SECONDS
+SEMANTIC_EMBEDDING_MODEL = "text-embedding-3-small"
+SEMANTIC_SIMILARITY_THRESHOLD = 0.97 # Cosine similarity at which a stored response is reused outright
+SEMANTIC_VERIFY_THRESHOLD = 0.85 # Between this and the above, a cheap model decides whether it's a hit
+SEMANTIC_VERIFY_MODEL = "gpt-4o-mini"
+
+_semantic_entries: Optional[List[Dict[str, Any]]] = None # Loaded lazily from SEMANTIC_CACHE_PATH
+_semantic_db: Optional[sqlite3.Connection] = None
+_semantic_lock = threading.Lock() # Guards both of the above across concurrent requests
+
+def _response_cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float) -> str:
+    """Builds a stable cache key from everything that influences the response."""
+    key_data = json.dumps(
+        {"model": model, "system": system_prompt, "user": user_prompt, "temp": temperature},
+        sort_keys=True
+    )
+    return hashlib.sha256(key_data.encode("utf-8")).hexdigest()
+
+def _load_cached_response(key: str) -> Optional[Dict[str, Any]]:
+    """Returns the cached response for `key`, or None if missing or expired."""
+    cache_path = os.path.join(OPENAI_CACHE_DIR, f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_path) > OPENAI_CACHE_TTL_SECONDS:
+            return None
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None # Treat unreadable entries as a miss
+
+def _store_cached_response(key: str, response: Dict[str, Any]) -> None:
+    """Writes a response to the cache. Failures are logged but never fatal."""
+    cache_path = os.path.join(OPENAI_CACHE_DIR, f"{key}.json")
+    try:
+        os.makedirs(OPENAI_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp" # Unique per writer, so concurrent stores of one key don't collide
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(response, f)
+        os.replace(tmp_path, cache_path) # Atomic, so readers never see a partial file
+    except OSError as e:
+        print(f"Warning: Could not write OpenAI response cache entry: {e}")
+
+def _recall_response(key: str) -> Optional[Dict[str, Any]]:
+    """Returns a copy of the response memoized in this process for `key`, if any."""
+    with _response_memo_lock:
+        if key not in _response_memo:
+            return None
+        _response_memo.move_to_end(key)
+        return copy.deepcopy(_response_memo[key]) # Callers may modify what they get back
+
+def _memoize_response(key: str, response: Dict[str, Any]) -> None:
+    """Keeps a copy of a response in memory, evicting the least recently used entries."""
+    with _response_memo_lock:
+        _response_memo[key] = copy.deepcopy(response)
+        _response_memo.move_to_end(key)
+        while len(_response_memo) > RESPONSE_MEMO_MAX_ENTRIES:
+            _response_memo.popitem(last=False)
+
+def _semantic_scope(model: str, system_prompt: str, temperature: float) -> str:
+    """Identifies which stored entries are comparable (same model, instructions and temperature)."""
+    scope_data = json.dumps({"model": model, "system": system_prompt, "temp": temperature}, sort_keys=True)
+    return hashlib.sha256(scope_data.encode("utf-8")).hexdigest()
+
+def _embed(text: str) -> Optional[List[float]]:
+    """Returns the embedding vector for `text`, or None if the request fails."""
+    try:
+        response = _limited_call(client.embeddings.create, model=SEMANTIC_EMBEDDING_MODEL, input=text)
+        return response.data[0].embedding
+    except OpenAIError as e:
+        print(f"Warning: Embedding request failed, skipping semantic cache: {e}")
+        return None
+
+def _open_semantic_db() -> sqlite3.Connection:
+    """Opens (creating if needed) the semantic index database and drops expired entries."""
+    os.makedirs(OPENAI_CACHE_DIR, exist_ok=True)
+    db = sqlite3.connect(SEMANTIC_CACHE_PATH, check_same_thread=False, isolation_level=None) # Autocommit
+    db.execute("PRAGMA journal_mode=WAL") # Readers in other processes don't block on writes
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS entries ("
+        "id INTEGER PRIMARY KEY, scope TEXT, created REAL, embedding BLOB, norm REAL, prompt TEXT, response TEXT)"
+    )
+    db.execute("DELETE FROM entries WHERE created < ?", (time.time() - OPENAI_CACHE_TTL_SECONDS,))
+    return db
+
+def _load_semantic_entries() -> List[Dict[str, Any]]:
+    """Returns the in-memory semantic index, reading it from disk on first use."""
+    global _semantic_entries, _semantic_db
+    with _semantic_lock:
+        if _semantic_entries is None:
+            _semantic_entries = []
+            try:
+                _semantic_db = _open_semantic_db()
+                rows = _semantic_db.execute("SELECT scope, embedding, norm, prompt, response FROM entries ORDER BY id")
+                for scope, embedding, norm, prompt, response in rows:
+                    _semantic_entries.append({
+                        "scope": scope, "embedding": array.array("d", embedding), "norm": norm,
+                        "prompt": prompt, "response": json.loads(response)
+                    })
+            except (OSError, sqlite3.Error, json.JSONDecodeError) as e:
+                print(f"Warning: Could not read semantic cache index: {e}")
+        return _semantic_entries
+
+def _confirm_equivalent(cached_prompt: str, user_prompt: str) -> bool:
+    """Asks a small model whether two prompts call for the same audio design."""
+    try:
+        response = _limited_call(
+            client.chat.completions.create,
+            model=SEMANTIC_VERIFY_MODEL,
+            messages=[
+                {"role": "system", "content": "You compare two requests for music and sound effect descriptions "
+                                              "for an audio quiz. Answer YES if one response would serve both "
+                                              "equally well (same script, theme, mood and audience), otherwise NO."},
+                {"role": "user", "content": f"Request A:\n{cached_prompt}\n\nRequest B:\n{user_prompt}"}
+            ],
+            temperature=0,
+            max_tokens=1
+        )
+        return (response.choices[0].message.content or "").strip().upper().startswith("YES")
+    except OpenAIError as e:
+        print(f"Warning: Semantic cache verification failed, treating as a miss: {e}")
+        return False
+
+def _semantic_lookup(scope: str, embedding: List[float], user_prompt: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the response of the most similar stored prompt if it is close enough.
+
+    Similarities above SEMANTIC_SIMILARITY_THRESHOLD are hits and those below
+    SEMANTIC_VERIFY_THRESHOLD are misses. In between, SEMANTIC_VERIFY_MODEL is
+    asked whether the two prompts are equivalent.
+    """
+    query_norm = math.sqrt(sum(x * x for x in embedding))
+    if query_norm == 0:
+        return None
+
+    best_similarity, best_entry = 0.0, None
+    for entry in _load_semantic_entries():
+        if entry["scope"] != scope:
+            continue
+        dot = sum(a * b for a, b in zip(entry["embedding"], embedding))
+        similarity = dot / (entry["norm"] * query_norm)
+        if similarity > best_similarity:
+            best_similarity, best_entry = similarity, entry
+
+    if best_similarity >= SEMANTIC_SIMILARITY_THRESHOLD:
+        print(f"\n--- Using semantically cached OpenAI response (similarity {best_similarity:.3f}) ---")
+        return copy.deepcopy(best_entry["response"]) # Callers may modify what they get back
+    if best_similarity >= SEMANTIC_VERIFY_THRESHOLD:
+        if _confirm_equivalent(best_entry["prompt"], user_prompt):
+            print(f"\n--- Using semantically cached OpenAI response (similarity {best_similarity:.3f}, verified) ---")
+            return copy.deepcopy(best_entry["response"])
+    return None
+
+def _semantic_store(scope: str, embedding: List[float], user_prompt: str, response: Dict[str, Any]) -> None:
+    """Adds an entry to the semantic index and persists it. Failures are logged but never fatal."""
+    norm = math.sqrt(sum(x * x for x in embedding))
+    if norm == 0:
+        return
+    entries = _load_semantic_entries()
+    packed_embedding = array.array("d", embedding)
+    with _semantic_lock:
+        entries.append({"scope": scope, "embedding": packed_embedding, "norm": norm, "prompt": user_prompt, "response": copy.deepcopy(response)})
+        if _semantic_db is None:
+            return # Opening the database already failed and was reported
+        try:
+            # One row per entry, so storing no longer rewrites the whole index
+            _semantic_db.execute(
+                "INSERT INTO entries (scope, created, embedding, norm, prompt, response) VALUES (?, ?, ?, ?, ?, ?)",
+                (scope, time.time(), packed_embedding.tobytes(), norm, user_prompt, json.dumps(response))
+            )
+        except sqlite3.Error as e:
+            print(f"Warning: Could not write semantic cache index: {e}")
+
+class _ScriptTrackScanner:
+    """
+    Scans a JSON response as it streams in and returns each element of the
+    top-level "script" array as soon as its closing bracket arrives.
+
+    Elements are returned with their index in the array. Scalar elements are
+    never returned but still counted, so indices always match the array.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string_start = 0
+        self._last_string = None # Most recent string at the top level of the object
+        self._current_key = None
+        self._in_script = False
+        self._track_start = None
+        self._track_index = 0 # Index of the current element of the script array
+
+    def feed(self, chunk: str) -> List[Tuple[int, Any]]:
+        """Adds streamed text and returns (index, track) for the tracks completed by it."""
+        self._text += chunk
+        tracks = []
+        text = self._text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:pos]
+            elif char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char == ":" and self._depth == 1:
+                self._current_key = self._last_string
+            elif char == "," and self._depth == 1:
+                self._current_key = None
+            elif char == "," and self._depth == 2 and self._in_script:
+                self._track_index += 1
+            elif char in "[{":
+                self._depth += 1
+                if self._depth == 2 and char == "[" and self._current_key == "script":
+                    self._in_script = True
+                elif self._depth == 3 and self._in_script:
+                    self._track_start = pos
+            elif char in "]}":
+                if self._depth == 3 and self._track_start is not None:
+                    tracks.append((self._track_index, json.loads(text[self._track_start:pos + 1])))
+                    self._track_start = None
+                self._depth -= 1
+                if self._depth == 1:
+                    self._in_script = False
+        self._pos = len(text)
+        return tracks
+
+def _stream_chat_completion(
+    request_args: Dict[str, Any],
+    on_track: Callable[[int, Any], None]
+) -> Tuple[str, Any]:
+    """
+    Streams a chat completion, calling on_track(index, track) for each script
+    track as soon as the model has finished writing it.
+
+    Returns:
+        The full response text and the usage reported at the end of the stream.
+    """
+    stream = client.chat.completions.create(
+        stream=True,
+        stream_options={"include_usage": True}, # Usage arrives in a final chunk without choices
+        **request_args
+    )
+    scanner = _ScriptTrackScanner()
+    content_parts = []
+    usage = None
+    for chunk in stream:
+        if chunk.usage is not None:
+            usage = chunk.usage
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        content = chunk.choices[0].delta.content
+        content_parts.append(content)
+        for index, track in scanner.feed(content):
+            on_track(index, track)
+    return "".join(content_parts), usage
+
+def get_audio_script_json(
+    prompt_request: PromptBundle,
+    model: str = "gpt-4o",
+    temperature: float = DEFAULT_TEMPERATURE,
+    on_track: Optional[Callable[[int, Any], None]] = None,
+    refresh: bool = False
+) -> Optional[Dict[str, Any]]:
     """
     Calls the OpenAI API with the generated prompts to get audio script JSON.
 
+    Responses are served from the on-disk cache when an identical request
+    (model, prompts and temperature) was already answered; at temperature 0 they
+    are also kept in memory for the rest of the process. With SEMANTIC_CACHE=1,
+    a response to a sufficiently similar user prompt is reused as well. With
+    refresh, cached responses are skipped and the new one replaces them.
+
+    When on_track is given the response is streamed and each track of the
+    "script" array is handed over as soon as it is complete, so audio generation
+    can start while the model is still writing later tracks. It is not called
+    for cached responses; callers should use the returned JSON for any tracks
+    they haven't received.
+
     Args:
-        prompt_request: The dictionary returned by create_music_gen_prompt,
-                        containing 'system_prompt' and 'prompt'.
+        prompt_request: The PromptBundle returned by create_music_gen_prompt.
         model: The OpenAI model to use (default: "gpt-4o").
+        temperature: Sampling temperature (0.0 to 2.0).
+        on_track: Optional callback receiving (track index, track events) while streaming.
+        refresh: Always call the API, even if a cached response exists.
 
     Returns:
         A dictionary parsed from the AI's JSON response, or None if an error occurs.
     """
-    if not client:
-        print("OpenAI client not initialized. Cannot make API call.")
-        return None
-
-    system_prompt = prompt_request.get("system_prompt")
-    user_prompt = prompt_request.get("prompt")
+    system_prompt = prompt_request.system_prompt
+    user_prompt = prompt_request.prompt
 
     if not system_prompt or not user_prompt:
         print("Error: Missing system_prompt or prompt in the request.")
         return None
 
+    cache_key = None
+    memoize = cache_enabled and temperature == 0
+    if cache_enabled:
+        cache_key = _response_cache_key(model, system_prompt, user_prompt, temperature)
+    if cache_key and not refresh:
+        cached_json = _recall_response(cache_key) if memoize else None
+        if cached_json is not None:
+            _count_cache_event("memory_hits")
+            print(f"\n--- Using OpenAI response from memory ({cache_key[:12]}) ---")
+            return cached_json
+        cached_json = _load_cached_response(cache_key)
+        if cached_json is not None:
+            _count_cache_event("hits")
+            print(f"\n--- Using cached OpenAI response ({cache_key[:12]}) ---")
+            if memoize:
+                _memoize_response(cache_key, cached_json)
+            return cached_json
+        _count_cache_event("misses")
+
+    if not client:
+        print("OpenAI client not initialized. Cannot make API call.")
+        return None
+
+    semantic_scope, prompt_embedding = None, None
+    if cache_enabled and semantic_cache_enabled:
+        semantic_scope = _semantic_scope(model, system_prompt, temperature)
+        prompt_embedding = _embed(user_prompt)
+        if prompt_embedding is not None and not refresh:
+            similar_json = _semantic_lookup(semantic_scope, prompt_embedding, user_prompt)
+            if similar_json is not None:
+                _count_cache_event("semantic_hits")
+                return similar_json
+
+    json_response_string = None
     try:
         print(f"\n--- Calling OpenAI API (Model: {model}) ---")
-        response = client.chat.completions.create(
+        request_args = dict(
             model=model,
             response_format={"type": "json_object"}, # Enforce JSON output
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_prompt}
             ],
-            temperature=0.7, # Adjust creativity (0.0 to 2.0)
+            temperature=temperature,
+            # Routes requests with the same prefix to the same OpenAI cache shard
+            extra_body={"prompt_cache_key": prompt_request.prompt_cache_key},
             # max_tokens=... # Optional: set a limit if needed
         )
+        if on_track:
+            with _REQUEST_SLOTS: # Held until the whole streamed response is read
+                _RATE_LIMITER.acquire()
+                json_response_string, usage = _stream_chat_completion(request_args, on_track)
+        else:
+            response = _limited_call(client.chat.completions.create, **request_args)
+            usage = response.usage
+            # Extract the JSON string content
+            json_response_string = response.choices[0].message.content
+
+        usage_details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(usage_details, "cached_tokens", None)
+        if cached_tokens is not None:
+            print(f"Prompt tokens: {usage.prompt_tokens} ({cached_tokens} served from OpenAI prompt cache)")
 
-        # Extract the JSON string content
-        json_response_string = response.choices[0].message.content
         print("--- Raw JSON Response from API ---")
         print(json_response_string)
 
@@ -63,6 +476,13 @@ def get_audio_script_json(prompt_request: Dict[str, Any], model: str = "gpt-4o")
         print("\n--- Parsed JSON Object ---")
         # print(json.dumps(parsed_json, indent=2)) # Pretty print
 
+        if cache_key:
+            _store_cached_response(cache_key, parsed_json)
+        if memoize:
+            _memoize_response(cache_key, parsed_json)
+        if prompt_embedding is not None:
+            _semantic_store(semantic_scope, prompt_embedding, user_prompt, parsed_json)
+
         return parsed_json
 
     except OpenAIError as e:
@@ -102,7 +522,7 @@ track_4:
     # 1. Generate the prompt request
     prompt_req = create_music_gen_prompt(input_data)
 
-    # Check if prompt generation was successful (it returns a dict)
+    # Check if prompt generation was successful (it returns a PromptBundle)
     if prompt_req:
         # 2. Call the OpenAI API with the request
         audio_json_output = get_audio_script_json(prompt_req, model="gpt-4o") # Specify gpt-4o
@@ -115,4 +535,146 @@ track_4:
         else:
             print("\nFailed to get valid JSON response from OpenAI.")
     else:
-        print("Failed to generate prompt request.")
\ No newline at end of file
+        print("Failed to generate prompt request.")
+
+def get_audio_script_json_concurrent(
+    prompt_requests: List[PromptBundle],
+    model: str = "gpt-4o",
+    temperature: float = DEFAULT_TEMPERATURE
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Gets audio script JSON for several prompt requests right away, running the
+    calls concurrently within OPENAI_MAX_IN_FLIGHT and OPENAI_MAX_REQUESTS_PER_SECOND.
+
+    Use get_audio_script_json_batch instead when results can wait, as batch
+    requests are cheaper.
+
+    Args:
+        prompt_requests: PromptBundles returned by create_music_gen_prompt.
+        model: The OpenAI model to use (default: "gpt-4o").
+        temperature: Sampling temperature (0.0 to 2.0).
+
+    Returns:
+        One parsed JSON dictionary (or None on failure) per prompt request, in order.
+    """
+    with ThreadPoolExecutor(max_workers=OPENAI_MAX_IN_FLIGHT) as executor:
+        return list(executor.map(
+            lambda request: get_audio_script_json(request, model=model, temperature=temperature),
+            prompt_requests
+        ))
+
+def get_audio_script_json_batch(
+    prompt_requests: List[PromptBundle],
+    model: str = "gpt-4o",
+    temperature: float = DEFAULT_TEMPERATURE
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    Gets audio script JSON for several prompt requests through OpenAI's Batch API.
+
+    Batch requests are billed at half price and don't count against the regular
+    rate limits, but can take up to 24 hours to complete, so this is meant for
+    queued, non-interactive runs. Cached responses are reused and only the
+    misses are submitted. A single request goes through get_audio_script_json.
+
+    Args:
+        prompt_requests: PromptBundles returned by create_music_gen_prompt.
+        model: The OpenAI model to use (default: "gpt-4o").
+        temperature: Sampling temperature (0.0 to 2.0).
+
+    Returns:
+        One parsed JSON dictionary (or None on failure) per prompt request, in order.
+    """
+    if len(prompt_requests) <= 1:
+        return [get_audio_script_json(request, model=model, temperature=temperature) for request in prompt_requests]
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(prompt_requests)
+    cache_keys: Dict[int, str] = {}
+    batch_lines = []
+    for index, request in enumerate(prompt_requests):
+        system_prompt = request.system_prompt
+        user_prompt = request.prompt
+        if not system_prompt or not user_prompt:
+            print(f"Error: Missing system_prompt or prompt in batch request {index}.")
+            continue
+
+        if cache_enabled:
+            cache_keys[index] = _response_cache_key(model, system_prompt, user_prompt, temperature)
+            cached_json = _load_cached_response(cache_keys[index])
+            if cached_json is not None:
+                _count_cache_event("hits")
+                results[index] = cached_json
+                continue
+            _count_cache_event("misses")
+
+        batch_lines.append(json.dumps({
+            "custom_id": f"request-{index}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "response_format": {"type": "json_object"},
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                "temperature": temperature,
+                "prompt_cache_key": request.prompt_cache_key
+            }
+        }))
+
+    if not batch_lines:
+        return results
+    if not client:
+        print("OpenAI client not initialized. Cannot make API call.")
+        return results
+
+    try:
+        print(f"\n--- Submitting OpenAI batch of {len(batch_lines)} requests (Model: {model}) ---")
+        batch_file = client.files.create(
+            file=("audio_script_requests.jsonl", "\n".join(batch_lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        print(f"Batch {batch.id} created, waiting for completion...")
+
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            time.sleep(BATCH_POLL_INTERVAL_SECONDS)
+            batch = client.batches.retrieve(batch.id)
+            counts = batch.request_counts
+            if counts:
+                print(f"Batch {batch.id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+
+        if batch.status != "completed" or not batch.output_file_id:
+            print(f"Error: Batch {batch.id} ended with status '{batch.status}'.")
+            return results
+
+        output_text = client.files.content(batch.output_file_id).text
+    except OpenAIError as e:
+        print(f"An OpenAI API error occurred while running the batch: {e}")
+        return results
+
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            index = int(record["custom_id"].split("-", 1)[1])
+            response = record.get("response") or {}
+            if response.get("status_code") != 200:
+                print(f"Error: Batch request {index} failed: {record.get('error') or response.get('body')}")
+                continue
+            parsed_json = json.loads(response["body"]["choices"][0]["message"]["content"])
+        except (json.JSONDecodeError, KeyError, IndexError, ValueError, TypeError) as e:
+            print(f"Error parsing batch output line: {e}")
+            continue
+
+        results[index] = parsed_json
+        if index in cache_keys:
+            _store_cached_response(cache_keys[index], parsed_json)
+
+    print(f"--- Batch finished: {sum(r is not None for r in results)}/{len(results)} scripts available ---")
+    return results
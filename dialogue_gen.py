@@ -1,33 +1,75 @@
 import requests
 import os
+import io
 import time
-from typing import Optional
+import atexit
+import threading
+import zipfile
+import email.policy
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from typing import List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from file_cache import CACHE_ROOT, make_cache_key, fetch_cached_bytes, store_cached_bytes
 
 # --- Configuration ---
 # You can keep the URL here or load it from configuration/environment variables
 TTS_API_URL = "http://144.24.138.210:5000/"
 REQUEST_TIMEOUT_SECONDS = 30 # Timeout for the HTTP request
 
+# Optional batch endpoint: accepts a JSON POST of {"texts": [...], "speaker_id": N}
+# and returns a zip archive (or multipart/mixed body) with one WAV per text, in order.
+# When unset or unsupported, lines are requested one at a time instead.
+TTS_BATCH_API_URL = os.environ.get("TTS_BATCH_API_URL")
+BATCH_REQUEST_TIMEOUT_SECONDS = 120 # A batch synthesizes many lines in one request
+MAX_CONCURRENT_REQUESTS = 8 # TTS requests in flight at once, across every caller in the process
+_batch_supported = True # Flipped off if the server rejects batch requests
+TTS_CACHE_DIR = os.path.join(CACHE_ROOT, "tts") # Generated lines, keyed by (speaker_id, text)
+
+# The TTS service has its own concurrency limit, independent of Fal.ai's, so
+# requests are bounded here rather than by whoever happens to be calling
+_REQUEST_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# Shared session so repeated TTS calls reuse pooled keep-alive connections
+# instead of opening a new TCP connection per line of dialogue. Transient
+# failures are retried so one rate-limited call doesn't fail the whole run.
+_SESSION = requests.Session()
+_SESSION.mount(
+    "http://",
+    HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(
+            total=5,
+            backoff_factor=1, # Exponential backoff between attempts: 1s, 2s, 4s, ...
+            status_forcelist=[429, 500, 502, 503, 504], # Retry-After is honored for 429/503
+            allowed_methods=["GET", "POST"], # Also covers the batch endpoint
+            raise_on_status=False # Hand the final response to raise_for_status below
+        )
+    )
+)
+atexit.register(_SESSION.close)
+
 # --- Dialogue Generation Function ---
 
-def generate_and_save_dialogue(
-    text: str,
-    speaker_id: int,
-    output_filepath: str
-) -> bool:
+def generate_dialogue(text: str, speaker_id: int) -> Optional[bytes]:
     """
-    Generates dialogue audio using a TTS service and saves it to a local file.
+    Generates dialogue audio using a TTS service.
 
     Args:
         text: The text content to convert to speech.
         speaker_id: The integer ID of the desired speaker voice.
-        output_filepath: The full path (including directory and filename with extension,
-                         e.g., 'output/audio/dialogue_1.wav') where the audio
-                         will be saved.
 
     Returns:
-        True if the audio was successfully generated and saved, False otherwise.
+        The generated audio file contents (WAV), or None if the request failed.
     """
+    cache_key = make_cache_key(speaker_id, text)
+    cached_audio = fetch_cached_bytes(TTS_CACHE_DIR, cache_key)
+    if cached_audio is not None:
+        print(f"Using cached TTS for speaker {speaker_id}: '{text[:50]}...'")
+        return cached_audio
+
     print(f"Requesting TTS for speaker {speaker_id}: '{text[:50]}...'") # Log truncated text
 
     # Prepare query parameters
@@ -36,35 +78,26 @@ def generate_and_save_dialogue(
         "speaker_id": speaker_id
     }
 
+    _REQUEST_SLOTS.acquire()
     try:
         # Make the GET request to the TTS service
-        response = requests.get(
+        response = _SESSION.get(
             TTS_API_URL,
             params=params,
-            timeout=REQUEST_TIMEOUT_SECONDS,
-            stream=True # Use stream=True for potentially large audio files
+            timeout=REQUEST_TIMEOUT_SECONDS
         )
 
         # Check if the request was successful (status code 2xx)
         response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
 
-        # Ensure the output directory exists
-        output_dir = os.path.dirname(output_filepath)
-        if output_dir: # Only create if output_dir is not empty (i.e., not saving in current dir)
-            os.makedirs(output_dir, exist_ok=True) # exist_ok=True prevents error if dir exists
-
-        # Save the audio content to the specified file
-        print(f"Saving audio to: {output_filepath}")
-        with open(output_filepath, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192): # Read in chunks
-                f.write(chunk)
-
-        print(f"Successfully saved dialogue audio to {output_filepath}")
-        return True
+        audio_content = response.content
+        print(f"Received dialogue audio ({len(audio_content)} bytes) for: '{text[:50]}...'")
+        store_cached_bytes(TTS_CACHE_DIR, cache_key, audio_content)
+        return audio_content
 
     except requests.exceptions.Timeout:
         print(f"Error: TTS request timed out after {REQUEST_TIMEOUT_SECONDS} seconds.")
-        return False
+        return None
     except requests.exceptions.HTTPError as http_err:
         print(f"Error: TTS service returned HTTP error: {http_err}")
         # You might want to read response.text here for more details if available
@@ -72,16 +105,158 @@ def generate_and_save_dialogue(
              print(f"Error details: {response.text}")
         except Exception:
              pass # Ignore errors reading the error response body
-        return False
+        return None
     except requests.exceptions.RequestException as req_err:
         print(f"Error: Failed to connect to TTS service at {TTS_API_URL}. Error: {req_err}")
+        return None
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return None
+    finally:
+        _REQUEST_SLOTS.release()
+
+def generate_and_save_dialogue(
+    text: str,
+    speaker_id: int,
+    output_filepath: str
+) -> bool:
+    """
+    Generates dialogue audio using a TTS service and saves it to a local file.
+
+    Args:
+        text: The text content to convert to speech.
+        speaker_id: The integer ID of the desired speaker voice.
+        output_filepath: The full path (including directory and filename with extension,
+                         e.g., 'output/audio/dialogue_1.wav') where the audio
+                         will be saved.
+
+    Returns:
+        True if the audio was successfully generated and saved, False otherwise.
+    """
+    audio_content = generate_dialogue(text, speaker_id)
+    if audio_content is None:
         return False
+
+    try:
+        # Ensure the output directory exists
+        output_dir = os.path.dirname(output_filepath)
+        if output_dir: # Only create if output_dir is not empty (i.e., not saving in current dir)
+            os.makedirs(output_dir, exist_ok=True) # exist_ok=True prevents error if dir exists
+
+        # Save the audio content to the specified file
+        print(f"Saving audio to: {output_filepath}")
+        with open(output_filepath, 'wb') as f:
+            f.write(audio_content)
+
+        print(f"Successfully saved dialogue audio to {output_filepath}")
+        return True
+
     except OSError as os_err:
         print(f"Error: Failed to write audio file to {output_filepath}. Error: {os_err}")
         return False
-    except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return False
+
+def _split_batch_response(response: requests.Response) -> Optional[List[bytes]]:
+    """
+    Splits a batch TTS response into one audio payload per input text.
+
+    Supports a zip archive (entries in archive order) or a multipart/mixed body
+    (parts in order). Returns None if the format is not recognized.
+    """
+    content_type = response.headers.get("Content-Type", "")
+    if content_type.startswith("multipart/"):
+        message = BytesParser(policy=email.policy.default).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode("utf-8") + response.content
+        )
+        # get_payload(decode=True) is always bytes; get_content() gives str for untyped (text/plain) parts
+        return [part.get_payload(decode=True) for part in message.iter_parts()]
+    if zipfile.is_zipfile(io.BytesIO(response.content)):
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            return [archive.read(info) for info in archive.infolist() if not info.is_dir()]
+    return None
+
+def _request_dialogue_batch(texts: List[str], speaker_id: int) -> Optional[List[bytes]]:
+    """
+    Sends all texts to the batch TTS endpoint in one request.
+
+    Returns:
+        The audio bytes for each text in order, or None if batching is not
+        configured, not supported by the server, or the request failed.
+    """
+    global _batch_supported
+    if not TTS_BATCH_API_URL or not _batch_supported:
+        return None
+
+    print(f"Requesting batch TTS for {len(texts)} lines (speaker {speaker_id})...")
+    _REQUEST_SLOTS.acquire()
+    try:
+        response = _SESSION.post(
+            TTS_BATCH_API_URL,
+            json={"texts": texts, "speaker_id": speaker_id},
+            timeout=BATCH_REQUEST_TIMEOUT_SECONDS
+        )
+        if response.status_code in (404, 405, 501):
+            print("TTS service does not support batch requests; falling back to one request per line.")
+            _batch_supported = False # Don't ask again for the rest of this run
+            return None
+        response.raise_for_status()
+
+        audio_parts = _split_batch_response(response)
+        if audio_parts is None or len(audio_parts) != len(texts):
+            print("Error: Unexpected batch TTS response "
+                  f"({response.headers.get('Content-Type')}, {len(audio_parts or [])} parts for {len(texts)} texts).")
+            return None
+        return audio_parts
+
+    except requests.exceptions.RequestException as req_err:
+        print(f"Error: Batch TTS request to {TTS_BATCH_API_URL} failed. Error: {req_err}")
+        return None
+    except (zipfile.BadZipFile, ValueError) as parse_err:
+        print(f"Error: Could not parse batch TTS response. Error: {parse_err}")
+        return None
+    finally:
+        _REQUEST_SLOTS.release()
+
+def generate_dialogue_batch(texts: List[str], speaker_id: int) -> List[Optional[bytes]]:
+    """
+    Generates audio for several dialogue lines.
+
+    If TTS_BATCH_API_URL is set, all lines are sent in a single request.
+    Otherwise (or if the batch request fails) each line is requested
+    individually, with up to MAX_CONCURRENT_REQUESTS requests in flight.
+
+    Args:
+        texts: The dialogue lines to convert to speech.
+        speaker_id: The integer ID of the desired speaker voice.
+
+    Returns:
+        The audio file contents (WAV) for each line in order, None where generation failed.
+    """
+    # Lines already in the TTS cache don't need to be synthesized again
+    results: List[Optional[bytes]] = [None] * len(texts)
+    pending = []
+    for index, text in enumerate(texts):
+        results[index] = fetch_cached_bytes(TTS_CACHE_DIR, make_cache_key(speaker_id, text))
+        if results[index] is None:
+            pending.append(index)
+    if len(pending) < len(texts):
+        print(f"Using cached TTS for {len(texts) - len(pending)}/{len(texts)} dialogue lines.")
+    if not pending:
+        return results
+
+    audio_parts = _request_dialogue_batch([texts[index] for index in pending], speaker_id)
+    if audio_parts is not None:
+        for index, audio_content in zip(pending, audio_parts):
+            results[index] = audio_content
+            store_cached_bytes(TTS_CACHE_DIR, make_cache_key(speaker_id, texts[index]), audio_content)
+        print(f"Received {len(audio_parts)} dialogue lines from batch TTS response.")
+        return results
+
+    # Fall back to individual requests, run concurrently over the shared session
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS) as executor:
+        generated = executor.map(lambda index: generate_dialogue(texts[index], speaker_id), pending)
+        for index, audio_content in zip(pending, generated):
+            results[index] = audio_content
+    return results
 
 # --- Example Usage ---
 if __name__ == "__main__":
@@ -0,0 +1,72 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+# --- Configuration ---
+# Generated audio is cached on disk, content-addressed by the request that
+# produced it, so re-running a script doesn't regenerate identical clips.
+# Set AUDIO_CACHE=0 to disable.
+CACHE_ROOT = os.path.expanduser(os.environ.get("MUSIC_THING_CACHE_DIR", "~/.cache/music-thing"))
+cache_enabled = os.environ.get("AUDIO_CACHE", "1") != "0"
+MEMORY_CACHE_MAX_ENTRIES = 64 # Most recently used clips also kept in memory for the life of the process
+
+_memory_cache: "OrderedDict[str, bytes]" = OrderedDict() # Cache file path -> audio, least recently used first
+_memory_cache_lock = threading.Lock()
+_created_dirs = set() # Cache directories already created by this process
+
+def make_cache_key(*parts) -> str:
+    """Hashes the request parameters that determine a generated file."""
+    return hashlib.sha256("\x00".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+def _remember(cached_filepath: str, audio_content: bytes) -> None:
+    """Adds audio to the in-memory cache, evicting the least recently used entries."""
+    with _memory_cache_lock:
+        _memory_cache[cached_filepath] = audio_content
+        _memory_cache.move_to_end(cached_filepath)
+        while len(_memory_cache) > MEMORY_CACHE_MAX_ENTRIES:
+            _memory_cache.popitem(last=False)
+
+def fetch_cached_bytes(cache_dir: str, key: str) -> Optional[bytes]:
+    """
+    Reads the cached audio for `key`, from memory if it was used recently in
+    this process and from disk otherwise.
+
+    Returns:
+        The cached bytes, or None on a miss or error.
+    """
+    if not cache_enabled:
+        return None
+    cached_filepath = os.path.join(cache_dir, f"{key}.wav")
+    with _memory_cache_lock:
+        if cached_filepath in _memory_cache:
+            _memory_cache.move_to_end(cached_filepath)
+            return _memory_cache[cached_filepath]
+    try:
+        with open(cached_filepath, "rb") as f:
+            audio_content = f.read()
+        _remember(cached_filepath, audio_content)
+        return audio_content
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        print(f"Warning: Could not use cached file {cached_filepath}: {e}")
+        return None
+
+def store_cached_bytes(cache_dir: str, key: str, audio_content: bytes) -> None:
+    """Adds freshly generated audio to the cache. Failures are logged but never fatal."""
+    if not cache_enabled:
+        return
+    cached_filepath = os.path.join(cache_dir, f"{key}.wav")
+    _remember(cached_filepath, audio_content)
+    try:
+        if cache_dir not in _created_dirs: # Skip the makedirs syscalls on every store after the first
+            os.makedirs(cache_dir, exist_ok=True)
+            _created_dirs.add(cache_dir)
+        tmp_filepath = f"{cached_filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filepath, "wb") as f:
+            f.write(audio_content)
+        os.replace(tmp_filepath, cached_filepath) # Atomic, so readers never see a partial file
+    except OSError as e:
+        print(f"Warning: Could not add {cached_filepath} to the cache: {e}")
@@ -1,13 +1,16 @@
 import json
 import os
 import time
-import shutil # For removing temporary directory
+import io
 import math
-from typing import Optional
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
 from call_openai_api import get_audio_script_json
 import prompt # Assuming prompt.py contains AudioScriptInput and create_music_gen_prompt
-from dialogue_gen import generate_and_save_dialogue
-from music_gen import generate_and_save_music
+from dialogue_gen import generate_dialogue_batch, MAX_CONCURRENT_REQUESTS as MAX_CONCURRENT_TTS_REQUESTS
+from music_gen import generate_music, MAX_CONCURRENT_REQUESTS as MAX_CONCURRENT_MUSIC_REQUESTS
+from audio_utils import decode_wav, concatenate_segments, overlay_with_gain, export_mp3, Mp3StreamWriter
 
 # --- Pydub Setup ---
 # Make sure ffmpeg or libav is installed and accessible in your PATH
@@ -24,26 +27,77 @@ except ImportError:
 
 # --- Configuration ---
 OUTPUT_DIR = "final_audio_output"
-TEMP_AUDIO_DIR = os.path.join(OUTPUT_DIR, "temp_audio")
 DIALOGUE_SPEAKER_ID = 33 # As requested
 MUSIC_OVERLAY_VOLUME_REDUCTION_DB = 20 # Reduce music volume by 20 dB for overlay (approx 10% amplitude)
 BGM_OVERLAY_VOLUME_REDUCTION_DB = 26 # Reduce BGM volume by 26 dB for overlay (approx 5% amplitude)
 BGM_DURATION_SECONDS = 30 # Generate a 30-second BGM track
+EXPORT_NO_BGM_VERSION = False # Also export the quiz without the overall BGM (always done when there is no BGM)
+SCRIPT_MODEL = "gpt-4o"
+MUSIC_DURATION_SLACK_SECONDS = 2 # Extra music requested beyond the estimated dialogue length; trimmed after mixing
 
-def get_audio_duration_ms(filepath: str) -> Optional[int]:
-    """Gets the duration of an audio file in milliseconds using pydub."""
-    if not AudioSegment: return None
+def load_script_json(filepath: str) -> Optional[Dict]:
+    """Loads a previously saved AI script JSON, or returns None if it can't be read."""
     try:
-        audio = AudioSegment.from_file(filepath)
-        return len(audio) # pydub duration is in milliseconds
-    except Exception as e:
-        print(f"Error getting duration for {filepath}: {e}")
+        with open(filepath, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: Could not read cached script {filepath}: {e}")
         return None
 
-def main():
+def get_event_type(event) -> Optional[str]:
+    """
+    Classifies a script event.
+
+    Returns:
+        "dialogue" for dialogue with background music, "standalone" for
+        standalone music/SFX, "invalid_duration" for standalone music with a
+        bad duration, or None for an unrecognized structure.
+    """
+    if not isinstance(event, dict) or not isinstance(event.get("music"), str):
+        return None
+    if isinstance(event.get("dialogue"), str):
+        return "dialogue"
+    if "duration" in event and "dialogue" not in event:
+        duration_sec = event["duration"]
+        if not isinstance(duration_sec, int) or duration_sec <= 0:
+            return "invalid_duration"
+        return "standalone"
+    return None
+
+def export_without_bgm(final_audio, final_filepath: str) -> bool:
+    """
+    Exports the quiz without the overall BGM, used when the BGM version can't be produced.
+
+    Returns:
+        True if the file was exported, False otherwise.
+    """
+    print(f"Exporting the version without overall BGM instead: {final_filepath}")
+    try:
+        export_mp3(final_audio, final_filepath)
+        print(f"Successfully exported audio file without BGM!")
+        return True
+    except Exception as e:
+        print(f"ERROR: Failed to export audio without BGM: {e}")
+        return False
+
+def estimate_tts_duration_sec(text: str) -> int:
+    """
+    Estimates how long the TTS service will take to speak `text`.
+
+    Uses a speaking rate of about 150 words per minute (2.5 words per second),
+    with a 3 second minimum. Lets background music be requested before the
+    dialogue audio exists.
+    """
+    return max(3, math.ceil(len(text.split()) / 2.5))
+
+def main(cached_script_path: Optional[str] = None, refresh_script: bool = False):
     """
     Main function to define input, generate prompt, call API,
     generate audio components, and combine them.
+
+    Args:
+        cached_script_path: Use the AI script JSON at this path instead of calling the API.
+        refresh_script: Skip the cached OpenAI response and request a new script.
     """
     if not AudioSegment:
         print("Cannot proceed without pydub library and its dependencies (ffmpeg/libav).")
@@ -112,208 +166,258 @@ If you got it wrong, no problem, you’ll get the next one. Here we go!
     )
     print(f"Input Theme: {input_data.quiz_theme}, Mood: {input_data.mood}, Target Age: {input_data.target_age}")
 
-    print("\nGenerating prompt for AI...")
-    prompt_req = prompt.create_music_gen_prompt(input_data)
-
-    if not prompt_req:
-        print("Error: Failed to generate prompt request.")
-        return
-
-    print("\nCalling OpenAI API for audio script structure...")
-    audio_json_output = get_audio_script_json(prompt_req, model="gpt-4o")
-
-    if not audio_json_output:
-        print("\n--- Failed to get valid JSON response from OpenAI ---")
-        return
-
-    print("\n--- Successfully Received and Parsed Audio Script JSON ---")
-    # print(json.dumps(audio_json_output, indent=2)) # Optionally print the received JSON
-
-    # --- 2. Setup Output Directories ---
+    # --- 2. Setup Output Directory ---
+    # Generated clips stay in memory; only the final MP3s are written to disk
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    # Clean up temp directory if it exists from a previous run
-    if os.path.exists(TEMP_AUDIO_DIR):
-        shutil.rmtree(TEMP_AUDIO_DIR)
-    os.makedirs(TEMP_AUDIO_DIR, exist_ok=True)
-    print(f"Created temporary directory: {TEMP_AUDIO_DIR}")
 
     # --- 3. Process JSON and Generate Audio Components ---
-    final_audio = AudioSegment.empty() # Initialize empty audio segment for combining
-    script_data = audio_json_output.get("script")
-
-    if not script_data or not isinstance(script_data, list):
-        print("Error: 'script' key missing or not a list in the JSON response.")
-        return
+    track_segments = [] # Completed tracks, joined once into the final audio
+    total_duration_ms = 0
 
     processing_successful = True # Flag to track if all steps succeed
+    mp3_writer = None
 
-    try: # Use try...finally to ensure temp dir cleanup
-        for i, track_data in enumerate(script_data):
-            print(f"\n--- Processing Track {i+1} ---")
-            if not isinstance(track_data, list):
-                print(f"Warning: Track {i+1} data is not a list, skipping.")
-                continue
-
-            track_audio = AudioSegment.empty()
-
-            for j, event in enumerate(track_data):
-                event_audio = None
-                event_label = f"track_{i+1}_event_{j+1}"
-                print(f"  Processing Event {j+1}: {list(event.keys())}") # Show keys in the event dict
-
-                # --- Case 1: Dialogue with Background Music ---
-                if "dialogue" in event and "music" in event:
-                    dialogue_text = event["dialogue"]
-                    music_prompt = event["music"]
-                    dialogue_filename = f"{event_label}_dialogue.wav"
-                    music_filename = f"{event_label}_music.wav"
-                    dialogue_filepath = os.path.join(TEMP_AUDIO_DIR, dialogue_filename)
-                    music_filepath = os.path.join(TEMP_AUDIO_DIR, music_filename)
-
-                    print(f"    Generating dialogue: '{dialogue_text[:50]}...'")
-                    if not generate_and_save_dialogue(dialogue_text, DIALOGUE_SPEAKER_ID, dialogue_filepath):
-                        print(f"    ERROR: Failed to generate dialogue for event {j+1}. Skipping event.")
-                        processing_successful = False
-                        continue # Skip this event
-
-                    # Get dialogue duration to generate music of the same length
-                    dialogue_duration_ms = get_audio_duration_ms(dialogue_filepath)
-                    if dialogue_duration_ms is None:
-                         print(f"    ERROR: Could not get duration for {dialogue_filepath}. Skipping event.")
-                         processing_successful = False
-                         continue
-
-                    # Music generation often takes integer seconds, round up
-                    music_duration_sec = math.ceil(dialogue_duration_ms / 1000)
-                    print(f"    Dialogue duration: {dialogue_duration_ms / 1000:.2f}s. Generating music for {music_duration_sec}s.")
-                    print(f"    Generating music: '{music_prompt[:50]}...'")
-                    if not generate_and_save_music(music_prompt, music_duration_sec, music_filepath):
-                        print(f"    ERROR: Failed to generate music for event {j+1}. Using dialogue only.")
-                        # Proceed with just dialogue if music fails
-                        try:
-                            event_audio = AudioSegment.from_wav(dialogue_filepath)
-                        except Exception as e:
-                            print(f"      ERROR loading dialogue audio {dialogue_filepath}: {e}")
-                            processing_successful = False
-                        continue # Go to next event
+    try:
+        # --- 3a. Generate all dialogue/music clips concurrently ---
+        # Events are independent of each other, so every event across all tracks
+        # is generated at once; the assembly pass below still runs in script order.
+        # Identical lines/prompts within the script are generated only once and
+        # their audio is shared by every event that uses them.
+        dialogue_jobs = {}         # dialogue text -> (TTS batch future, index in that batch)
+        dialogue_music_jobs = {}   # (music prompt, dialogue text) -> future of WAV bytes
+        standalone_jobs = {}       # (music prompt, duration) -> future of WAV bytes
+        submitted_tracks = set()
+        # Each provider gets its own pool, sized to its request limit, so jobs waiting
+        # on one provider never hold the threads the other provider's jobs need
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_TTS_REQUESTS) as tts_executor, \
+             ThreadPoolExecutor(max_workers=MAX_CONCURRENT_MUSIC_REQUESTS) as music_executor:
+            def submit_track(i, track_data):
+                """Starts TTS for a track's new dialogue lines and its standalone music."""
+                submitted_tracks.add(i)
+                if not isinstance(track_data, list):
+                    return
+                new_texts = []
+                for event in track_data:
+                    event_type = get_event_type(event)
+                    if event_type == "dialogue":
+                        if event["dialogue"] not in dialogue_jobs and event["dialogue"] not in new_texts:
+                            new_texts.append(event["dialogue"])
+                        # Background music is sized from the estimated dialogue length, so it
+                        # generates alongside the TTS instead of waiting for it; the overlay
+                        # step trims it to the real dialogue
+                        job_key = (event["music"], event["dialogue"])
+                        if job_key not in dialogue_music_jobs:
+                            music_duration_sec = estimate_tts_duration_sec(event["dialogue"]) + MUSIC_DURATION_SLACK_SECONDS
+                            dialogue_music_jobs[job_key] = music_executor.submit(generate_music, event["music"], music_duration_sec)
+                    elif event_type == "standalone":
+                        job_key = (event["music"], event["duration"])
+                        if job_key not in standalone_jobs:
+                            standalone_jobs[job_key] = music_executor.submit(generate_music, job_key[0], job_key[1])
+                # The track's dialogue lines go to the TTS service together
+                # (a single request if it supports batching)
+                if new_texts:
+                    future = tts_executor.submit(generate_dialogue_batch, new_texts, DIALOGUE_SPEAKER_ID)
+                    for index, text in enumerate(new_texts):
+                        dialogue_jobs[text] = (future, index)
+                print(f"  Started generation for track {i+1} ({len(new_texts)} new dialogue lines)")
+
+            def cancel_pending_jobs():
+                """Cancels queued generation jobs once the run has failed, so they aren't paid for."""
+                for batch_future, _ in dialogue_jobs.values():
+                    batch_future.cancel()
+                for future in [*dialogue_music_jobs.values(), *standalone_jobs.values()]:
+                    future.cancel() # Jobs already running can't be stopped and finish on their own
+
+            print("\nGenerating prompt for AI...")
+            prompt_req = prompt.create_music_gen_prompt(input_data)
+
+            if not prompt_req:
+                print("Error: Failed to generate prompt request.")
+                return
+
+            # Re-runs with the same prompt are served from call_openai_api's response
+            # cache, so debugging the audio steps below doesn't wait on (or pay for)
+            # another API call. A user-supplied script file is only ever read.
+            audio_json_output = None
+            if cached_script_path:
+                print(f"\nLoading AI script from {cached_script_path}...")
+                audio_json_output = load_script_json(cached_script_path)
+
+            if not audio_json_output:
+                # The response is streamed, so each track's audio starts generating
+                # as soon as the model has written it
+                print("\nCalling OpenAI API for audio script structure...")
+                audio_json_output = get_audio_script_json(
+                    prompt_req, model=SCRIPT_MODEL, on_track=submit_track, refresh=refresh_script
+                )
+
+                if not audio_json_output:
+                    print("\n--- Failed to get valid JSON response from OpenAI ---")
+                    cancel_pending_jobs() # Tracks streamed before the failure were already submitted
+                    return
+
+            print("\n--- Successfully Received and Parsed Audio Script JSON ---")
+            # print(json.dumps(audio_json_output, indent=2)) # Optionally print the received JSON
+
+            script_data = audio_json_output.get("script")
+            if not script_data or not isinstance(script_data, list):
+                print("Error: 'script' key missing or not a list in the JSON response.")
+                cancel_pending_jobs()
+                return
+
+            # The overall BGM only depends on the script, so it generates alongside
+            # the tracks instead of after them
+            overall_bgm_description = audio_json_output.get("overall_bgm", "")
+            bgm_future = None
+            if overall_bgm_description:
+                bgm_future = music_executor.submit(generate_music, overall_bgm_description, BGM_DURATION_SECONDS)
+
+            # Cached scripts (and any track the stream didn't deliver) start here
+            for i, track_data in enumerate(script_data):
+                if i not in submitted_tracks:
+                    submit_track(i, track_data)
+            print(f"\nGenerating {len(dialogue_jobs)} unique dialogue lines and "
+                  f"{len(standalone_jobs)} unique standalone music/SFX clips...")
+
+            # --- 3b. Mix tracks in order while later ones are still generating ---
+            # Each track waits only for its own clips, and every finished track goes
+            # straight to a running MP3 encoder, so generation, mixing and encoding overlap.
+            timestamp = int(time.time())
+            final_filename = f"audio_quiz_output_{timestamp}.mp3" # Export as MP3 for smaller size
+            final_filepath = os.path.join(OUTPUT_DIR, final_filename)
+            # The version without the overall BGM is a full extra encode, so it is
+            # only produced when asked for or when there is no BGM to add
+            if EXPORT_NO_BGM_VERSION or bgm_future is None:
+                mp3_writer = Mp3StreamWriter(final_filepath)
+            decoded_segments = {} # (kind, job key) -> decoded clip, shared by every event that uses it
+
+            def decode_once(kind, job_key, audio_content):
+                """Decodes a generated clip the first time an event needs it."""
+                if (kind, job_key) not in decoded_segments:
+                    decoded_segments[(kind, job_key)] = decode_wav(audio_content)
+                return decoded_segments[(kind, job_key)]
+
+            for i, track_data in enumerate(script_data):
+                print(f"\n--- Processing Track {i+1} ---")
+                if not isinstance(track_data, list):
+                    print(f"Warning: Track {i+1} data is not a list, skipping.")
+                    continue
 
-                    # Load both and overlay
-                    try:
-                        dialogue_segment = AudioSegment.from_wav(dialogue_filepath)
-                        music_segment = AudioSegment.from_wav(music_filepath)
+                event_segments = [] # Event audio for this track, joined once at the end
 
-                        # Ensure music is at least as long as dialogue (it might be slightly longer due to rounding up)
-                        # Trim music if needed, though overlay handles mismatched lengths
-                        # music_segment = music_segment[:dialogue_duration_ms]
+                for j, event in enumerate(track_data):
+                    event_audio = None
+                    event_type = get_event_type(event)
+                    print(f"  Processing Event {j+1}: {list(event.keys()) if isinstance(event, dict) else event}")
 
-                        print(f"    Overlaying music (reduced by {MUSIC_OVERLAY_VOLUME_REDUCTION_DB} dB)")
-                        quieter_music = music_segment - MUSIC_OVERLAY_VOLUME_REDUCTION_DB
-                        event_audio = dialogue_segment.overlay(quieter_music)
+                    # --- Case 1: Dialogue with Background Music ---
+                    if event_type == "dialogue":
+                        # Waits only for the TTS request that contains this line
+                        batch_future, batch_index = dialogue_jobs[event["dialogue"]]
+                        dialogue_wav = batch_future.result()[batch_index]
+                        if dialogue_wav is None:
+                            print(f"    ERROR: Failed to generate dialogue for event {j+1}. Skipping event.")
+                            processing_successful = False
+                            continue # Skip this event
 
-                    except Exception as e:
-                         print(f"    ERROR loading or overlaying audio for event {j+1}: {e}")
-                         processing_successful = False
-                         # Attempt to use just dialogue if overlay fails
-                         try:
-                            event_audio = AudioSegment.from_wav(dialogue_filepath)
-                            print("      Using dialogue audio only due to overlay error.")
-                         except Exception as load_err:
-                             print(f"      ERROR loading dialogue audio after overlay failure: {load_err}")
-
-
-                # --- Case 2: Standalone Music/SFX ---
-                elif "music" in event and "duration" in event and "dialogue" not in event:
-                    music_prompt = event["music"]
-                    duration_sec = event["duration"]
-                    music_filename = f"{event_label}_standalone_music.wav"
-                    music_filepath = os.path.join(TEMP_AUDIO_DIR, music_filename)
-
-                    if not isinstance(duration_sec, int) or duration_sec <= 0:
-                        print(f"    Warning: Invalid duration ({duration_sec}) for standalone music in event {j+1}. Skipping.")
-                        continue
+                        dialogue_segment = decode_once("dialogue", event["dialogue"], dialogue_wav)
+                        if dialogue_segment is None:
+                            print(f"    ERROR: Dialogue audio for event {j+1} could not be decoded. Skipping event.")
+                            processing_successful = False
+                            continue
+
+                        job_key = (event["music"], event["dialogue"])
+                        music_audio = dialogue_music_jobs[job_key].result()
+                        music_segment = decode_once("music", job_key, music_audio) if music_audio is not None else None
+                        if music_segment is None:
+                            print(f"    ERROR: No music for event {j+1}. Using dialogue only.")
+                            # Proceed with just dialogue if music fails
+                            event_audio = dialogue_segment
+                        else:
+                            try:
+                                # Music is requested from an estimated length plus slack, so it usually runs
+                                # past the dialogue. Trim it first so the tail isn't format-converted and mixed for nothing.
+                                music_segment = music_segment[:len(dialogue_segment)]
+
+                                print(f"    Overlaying music (reduced by {MUSIC_OVERLAY_VOLUME_REDUCTION_DB} dB)")
+                                event_audio = overlay_with_gain(dialogue_segment, music_segment, -MUSIC_OVERLAY_VOLUME_REDUCTION_DB)
+
+                            except Exception as e:
+                                 print(f"    ERROR overlaying audio for event {j+1}: {e}")
+                                 processing_successful = False
+                                 # Use just dialogue if overlay fails
+                                 event_audio = dialogue_segment
+                                 print("      Using dialogue audio only due to overlay error.")
+
+
+                    # --- Case 2: Standalone Music/SFX ---
+                    elif event_type == "standalone":
+                        job_key = (event["music"], event["duration"])
+                        music_audio = standalone_jobs[job_key].result()
+
+                        if music_audio is None:
+                            print(f"    ERROR: Failed to generate standalone music for event {j+1}. Skipping event.")
+                            processing_successful = False
+                            continue
 
-                    print(f"    Generating standalone music/sfx for {duration_sec}s: '{music_prompt[:50]}...'")
-                    if not generate_and_save_music(music_prompt, duration_sec, music_filepath):
-                        print(f"    ERROR: Failed to generate standalone music for event {j+1}. Skipping event.")
-                        processing_successful = False
+                        event_audio = decode_once("standalone", job_key, music_audio)
+                        if event_audio is None:
+                             print(f"    ERROR: Standalone music for event {j+1} could not be decoded.")
+                             processing_successful = False
+
+                    # --- Invalid Event Structure ---
+                    elif event_type == "invalid_duration":
+                        print(f"    Warning: Invalid duration ({event['duration']}) for standalone music in event {j+1}. Skipping.")
+                        continue
+                    else:
+                        print(f"    Warning: Skipping event {j+1} due to unrecognized structure: {event}")
                         continue
 
-                    # Load the generated music
-                    try:
-                        event_audio = AudioSegment.from_wav(music_filepath)
-                    except Exception as e:
-                         print(f"    ERROR loading standalone music audio {music_filepath}: {e}")
-                         processing_successful = False
+                    # Append the processed audio for this event to the current track's audio
+                    if event_audio:
+                        event_segments.append(event_audio)
+                        print(f"    Appended {len(event_audio)/1000:.2f}s to track {i+1}")
 
-                # --- Invalid Event Structure ---
-                else:
-                    print(f"    Warning: Skipping event {j+1} due to unrecognized structure: {event}")
-                    continue
 
-                # Append the processed audio for this event to the current track's audio
-                if event_audio:
-                    track_audio += event_audio
-                    print(f"    Appended {len(event_audio)/1000:.2f}s to track {i+1}")
+                # Append the complete track audio to the final audio
+                track_audio = concatenate_segments(event_segments)
+                if len(track_audio) > 0:
+                    track_segments.append(track_audio)
+                    if mp3_writer:
+                        mp3_writer.write(track_audio) # Encodes in the background while later tracks are mixed
+                    total_duration_ms += len(track_audio)
+                    print(f"  Completed Track {i+1}, Total duration now: {total_duration_ms/1000:.2f}s")
+                else:
+                     print(f"  Warning: Track {i+1} resulted in empty audio.")
 
+        # Leaving the executor blocks wait for any generation still running
 
-            # Append the complete track audio to the final audio
-            if len(track_audio) > 0:
-                final_audio += track_audio
-                print(f"  Completed Track {i+1}, Total duration now: {len(final_audio)/1000:.2f}s")
-            else:
-                 print(f"  Warning: Track {i+1} resulted in empty audio.")
+        final_audio = concatenate_segments(track_segments)
 
-        # --- 4. Export First Combined Audio (without overall BGM) ---
-        if len(final_audio) > 0 and processing_successful:
-            timestamp = int(time.time())
-            final_filename = f"audio_quiz_output_{timestamp}.mp3" # Export as MP3 for smaller size
-            final_filepath = os.path.join(OUTPUT_DIR, final_filename)
-            print(f"\n--- Exporting First Combined Audio (without overall BGM) ---")
-            print(f"Saving to: {final_filepath}")
-            try:
-                final_audio.export(final_filepath, format="mp3")
-                print(f"Successfully exported first audio file!")
-            except Exception as e:
-                print(f"ERROR: Failed to export first audio: {e}")
-                processing_successful = False
-        
-        # --- 5. Generate and apply overall BGM track ---
+        # --- 4. Generate and apply overall BGM track ---
         if len(final_audio) > 0 and processing_successful:
-            # Extract overall BGM description from JSON
-            overall_bgm_description = audio_json_output.get("overall_bgm", "")
-            if overall_bgm_description:
-                print(f"\n--- Generating Overall BGM Track (30s) ---")
+            if bgm_future:
+                print(f"\n--- Applying Overall BGM Track ({BGM_DURATION_SECONDS}s) ---")
                 print(f"BGM Description: '{overall_bgm_description[:100]}...'")
                 
-                # Generate the overall BGM
-                bgm_filename = f"overall_bgm_{timestamp}.wav"
-                bgm_filepath = os.path.join(TEMP_AUDIO_DIR, bgm_filename)
+                # Generated in the background since the script arrived
+                bgm_audio = bgm_future.result()
                 
-                if generate_and_save_music(overall_bgm_description, BGM_DURATION_SECONDS, bgm_filepath):
+                if bgm_audio is not None:
                     try:
-                        # Load the BGM
-                        bgm_segment = AudioSegment.from_wav(bgm_filepath)
+                        # Decode the BGM
+                        bgm_segment = AudioSegment.from_wav(io.BytesIO(bgm_audio))
                         
-                        # Calculate how many times to loop the BGM
-                        final_duration_ms = len(final_audio)
-                        loops_needed = math.ceil(final_duration_ms / len(bgm_segment))
-                        
-                        print(f"Main track duration: {final_duration_ms/1000:.2f}s")
+                        print(f"Main track duration: {len(final_audio)/1000:.2f}s")
                         print(f"BGM duration: {len(bgm_segment)/1000:.2f}s")
-                        print(f"Looping BGM {loops_needed} times to cover main track")
-                        
-                        # Create extended BGM by looping
-                        extended_bgm = bgm_segment * loops_needed
+                        print(f"Looping BGM {math.ceil(len(final_audio) / len(bgm_segment))} times to cover main track")
                         
-                        # Trim to match main track duration exactly
-                        extended_bgm = extended_bgm[:final_duration_ms]
-                        
-                        # Reduce volume for background
-                        quieter_bgm = extended_bgm - BGM_OVERLAY_VOLUME_REDUCTION_DB
+                        # Overlay with main track at reduced volume. The BGM is looped while
+                        # mixing (gain, loop and mix in one pass), never as a full-length copy.
                         print(f"Applying BGM at reduced volume ({BGM_OVERLAY_VOLUME_REDUCTION_DB} dB reduction)")
-                        
-                        # Overlay with main track
-                        final_audio_with_bgm = final_audio.overlay(quieter_bgm)
+                        final_audio_with_bgm = overlay_with_gain(
+                            final_audio, bgm_segment, -BGM_OVERLAY_VOLUME_REDUCTION_DB, loop=True
+                        )
                         
                         # Export second file with BGM
                         final_with_bgm_filename = f"audio_quiz_with_bgm_{timestamp}.mp3"
@@ -321,13 +425,17 @@ If you got it wrong, no problem, you’ll get the next one. Here we go!
                         print(f"\n--- Exporting Second Combined Audio (with overall BGM) ---")
                         print(f"Saving to: {final_with_bgm_filepath}")
                         
-                        final_audio_with_bgm.export(final_with_bgm_filepath, format="mp3")
+                        export_mp3(final_audio_with_bgm, final_with_bgm_filepath)
                         print(f"Successfully exported second audio file with BGM!")
                         
                     except Exception as e:
                         print(f"ERROR: Failed to process or export BGM version: {e}")
+                        if not mp3_writer:
+                            export_without_bgm(final_audio, final_filepath)
                 else:
                     print(f"ERROR: Failed to generate overall BGM. Skipping second audio file.")
+                    if not mp3_writer:
+                        export_without_bgm(final_audio, final_filepath)
             else:
                 print(f"No overall BGM description found in the JSON response. Skipping second audio file.")
         elif not processing_successful:
@@ -335,18 +443,28 @@ If you got it wrong, no problem, you’ll get the next one. Here we go!
         else:
             print("\n--- No audio generated, final export skipped ---")
 
+        # --- 5. Finish First Combined Audio (without overall BGM) ---
+        # Waited on last: ffmpeg encodes the remaining tracks in the background
+        # while the BGM above is mixed and encoded, and the two files are independent
+        if mp3_writer:
+            print(f"\n--- Finishing First Combined Audio (without overall BGM) ---")
+            try:
+                mp3_writer.close()
+            except Exception as e:
+                if len(final_audio) > 0:
+                    print(f"ERROR: Failed to export first audio: {e}")
+                    processing_successful = False
+            if len(final_audio) > 0 and processing_successful:
+                print(f"Successfully exported first audio file to: {final_filepath}")
+            elif os.path.exists(final_filepath):
+                os.remove(final_filepath) # Tracks were encoded before the failure was known
+
     except Exception as e:
         print(f"\n--- An unexpected error occurred during audio processing: {e} ---")
         processing_successful = False
     finally:
-        # --- 6. Cleanup Temporary Files ---
-        if os.path.exists(TEMP_AUDIO_DIR):
-            print(f"\nCleaning up temporary directory: {TEMP_AUDIO_DIR}")
-            try:
-                shutil.rmtree(TEMP_AUDIO_DIR)
-                print("Temporary directory removed.")
-            except Exception as e:
-                print(f"Warning: Could not remove temporary directory {TEMP_AUDIO_DIR}: {e}")
+        if mp3_writer:
+            mp3_writer.abort() # Only if close() was never reached; stops ffmpeg and removes the partial MP3
 
     print("\nAudio Quiz Script Generation and Production finished.")
     if not processing_successful:
@@ -354,9 +472,16 @@ If you got it wrong, no problem, you’ll get the next one. Here we go!
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate an audio quiz from the sample script.")
+    parser.add_argument("--use-cached-script", metavar="PATH",
+                        help="Use a previously saved AI script JSON instead of calling OpenAI.")
+    parser.add_argument("--refresh-script", action="store_true",
+                        help="Ignore the cached OpenAI response and request a new script.")
+    args = parser.parse_args()
+
     # Ensure API keys are set before running main
     keys_ok = True
-    if "OPENAI_API_KEY" not in os.environ:
+    if "OPENAI_API_KEY" not in os.environ and not args.use_cached_script:
         print("FATAL ERROR: OPENAI_API_KEY environment variable not found.")
         keys_ok = False
     # Add check for FAL_API_KEY as it's needed by music_gen
@@ -366,6 +491,6 @@ if __name__ == "__main__":
          keys_ok = False
 
     if keys_ok:
-        main()
+        main(cached_script_path=args.use_cached_script, refresh_script=args.refresh_script)
     else:
         print("Please set the required API key environment variables and try again.")
\ No newline at end of file
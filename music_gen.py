@@ -3,7 +3,19 @@ import os
 import json
 import base64
 import time
+import random
+import atexit
+import threading
 from typing import Optional
+from requests.adapters import HTTPAdapter
+from file_cache import CACHE_ROOT, make_cache_key, fetch_cached_bytes, store_cached_bytes
+
+# orjson is optional: it parses the API responses faster than the stdlib json
+# module (its decode error subclasses json.JSONDecodeError, so handling is shared)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # --- Configuration ---
 # !! IMPORTANT: Set your Fal.ai API Key !!
@@ -13,30 +25,84 @@ FAL_API_KEY = os.environ.get("FAL_API_KEY") # Replace default or set env var
 FAL_API_URL = "https://fal.run/fal-ai/stable-audio"
 API_REQUEST_TIMEOUT_SECONDS = 120 # Timeout for the main API call (can take time)
 AUDIO_DOWNLOAD_TIMEOUT_SECONDS = 60 # Timeout for downloading the generated audio URL
+MUSIC_CACHE_DIR = os.path.join(CACHE_ROOT, "music") # Generated clips, keyed by (prompt, duration)
+MAX_CONCURRENT_REQUESTS = 4 # Fal.ai generations in flight at once, across every caller in the process
+MAX_API_ATTEMPTS = 4 # Tries per generation before giving up on rate limits, server errors or timeouts
+MAX_RETRY_DELAY_SECONDS = 60 # Cap on the exponential backoff between attempts
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Fal.ai rate-limits separately from the TTS service, so generations are bounded
+# here with their own limit
+_REQUEST_SLOTS = threading.BoundedSemaphore(MAX_CONCURRENT_REQUESTS)
+
+# Shared session so the API call and the audio download reuse pooled
+# keep-alive connections instead of a new TCP+TLS handshake per clip. The
+# stable-audio endpoint takes one prompt per call, so a quiz's clips are sent as
+# concurrent requests over these pooled connections (one per slot above).
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=MAX_CONCURRENT_REQUESTS * 2))
+atexit.register(_SESSION.close)
 
 # --- Music Generation Function ---
 
-def generate_and_save_music(
-    prompt: str,
-    duration_seconds: int,
-    output_filepath: str
-) -> bool:
+def _post_generation_request(payload: dict, headers: dict) -> requests.Response:
     """
-    Generates music using the Fal.ai Stable Audio API and saves it locally.
+    Sends the generation request to Fal.ai, retrying transient failures.
+
+    Rate limits (429), server errors (5xx) and timeouts are retried up to
+    MAX_API_ATTEMPTS times with exponential backoff plus jitter, so concurrent
+    requests that failed together don't all retry at the same moment. Any
+    other response is returned straight away.
+
+    Returns:
+        The last response received (which may still be an error response).
+
+    Raises:
+        requests.exceptions.Timeout: If the final attempt timed out.
+        requests.exceptions.RequestException: On any other request failure.
+    """
+    for attempt in range(1, MAX_API_ATTEMPTS + 1):
+        print(f"Calling Fal.ai API at {FAL_API_URL} (attempt {attempt}/{MAX_API_ATTEMPTS})...")
+        try:
+            response = _SESSION.post(
+                FAL_API_URL,
+                headers=headers,
+                json=payload,
+                timeout=API_REQUEST_TIMEOUT_SECONDS
+            )
+        except requests.exceptions.Timeout:
+            if attempt == MAX_API_ATTEMPTS:
+                raise
+            failure = f"timed out after {API_REQUEST_TIMEOUT_SECONDS} seconds"
+        else:
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt == MAX_API_ATTEMPTS:
+                return response
+            failure = f"returned HTTP {response.status_code}"
+
+        delay = min(MAX_RETRY_DELAY_SECONDS, 2 ** (attempt - 1)) + random.random()
+        print(f"Fal.ai API {failure}; retrying in {delay:.1f}s...")
+        time.sleep(delay)
+
+def generate_music(prompt: str, duration_seconds: int) -> Optional[bytes]:
+    """
+    Generates music using the Fal.ai Stable Audio API.
 
     Args:
         prompt: Text description of the music to generate.
         duration_seconds: Desired duration of the music in seconds.
-        output_filepath: Full path (including directory and filename with extension,
-                         e.g., 'output/music/intro_bgm.wav') to save the audio.
 
     Returns:
-        True if music generation and saving were successful, False otherwise.
+        The generated audio file contents (WAV), or None if generation failed.
     """
+    cache_key = make_cache_key(prompt, duration_seconds)
+    cached_audio = fetch_cached_bytes(MUSIC_CACHE_DIR, cache_key)
+    if cached_audio is not None:
+        print(f"Using cached music for prompt: '{prompt[:60]}...' (Duration: {duration_seconds}s)")
+        return cached_audio
 
     if not FAL_API_KEY or FAL_API_KEY == "YOUR_FAL_API_KEY_HERE":
         print("Error: Fal.ai API Key is missing. Please set the FAL_API_KEY.")
-        return False
+        return None
     print(f"Requesting music generation for prompt: '{prompt[:60]}...' (Duration: {duration_seconds}s)")
 
     # 1. Prepare request payload and headers
@@ -52,19 +118,14 @@ def generate_and_save_music(
 
     audio_content = None # Initialize variable to hold audio bytes
 
+    _REQUEST_SLOTS.acquire()
     try:
-        # 2. Make the POST request to Fal.ai API
-        print(f"Calling Fal.ai API at {FAL_API_URL}...")
-        response = requests.post(
-            FAL_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=API_REQUEST_TIMEOUT_SECONDS
-        )
+        # 2. Make the POST request to Fal.ai API (transient failures are retried)
+        response = _post_generation_request(payload, headers)
         response.raise_for_status() # Check for HTTP errors (4xx, 5xx)
 
         # 3. Process the API response
-        api_response_data = response.json()
+        api_response_data = orjson.loads(response.content) if orjson else response.json()
         # print(f"API Response Data: {json.dumps(api_response_data, indent=2)}") # Debugging
 
         audio_url = api_response_data.get("audio_file", {}).get("url")
@@ -72,7 +133,7 @@ def generate_and_save_music(
         if not audio_url:
             print(f"Error: API response did not contain an audio file URL.")
             print(f"Full response: {api_response_data}")
-            return False
+            return None
 
         print(f"Received audio URL: {audio_url[:100]}...") # Print truncated URL
 
@@ -86,14 +147,13 @@ def generate_and_save_music(
                 print(f"Successfully decoded base64 data ({len(audio_content)} bytes).")
             except (ValueError, base64.binascii.Error) as decode_err:
                 print(f"Error: Failed to parse or decode base64 data URI: {decode_err}")
-                return False
+                return None
         else:
             print(f"Downloading audio from URL: {audio_url}...")
             try:
-                download_response = requests.get(
+                download_response = _SESSION.get(
                     audio_url,
-                    timeout=AUDIO_DOWNLOAD_TIMEOUT_SECONDS,
-                    stream=True
+                    timeout=AUDIO_DOWNLOAD_TIMEOUT_SECONDS
                 )
                 download_response.raise_for_status() # Check download request status
 
@@ -103,62 +163,87 @@ def generate_and_save_music(
 
             except requests.exceptions.Timeout:
                 print(f"Error: Audio download timed out after {AUDIO_DOWNLOAD_TIMEOUT_SECONDS} seconds.")
-                return False
+                return None
             except requests.exceptions.HTTPError as http_err_download:
                 print(f"Error: Failed to download audio. URL returned HTTP error: {http_err_download}")
                 try:
                      print(f"Download error details: {download_response.text}")
                 except Exception:
                      pass
-                return False
+                return None
             except requests.exceptions.RequestException as req_err_download:
                 print(f"Error: Failed to connect to audio download URL {audio_url}. Error: {req_err_download}")
-                return False
+                return None
 
-        # 5. Save the audio content to the specified file
-        if audio_content:
-            print(f"Saving audio to: {output_filepath}")
-            try:
-                # Ensure the output directory exists
-                output_dir = os.path.dirname(output_filepath)
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-
-                with open(output_filepath, 'wb') as f:
-                    f.write(audio_content)
-
-                print(f"Successfully saved music audio to {output_filepath}")
-                return True
-            except OSError as os_err:
-                print(f"Error: Failed to write audio file to {output_filepath}. Error: {os_err}")
-                return False
-        else:
+        if not audio_content:
             # This case should ideally be caught earlier, but added as a safeguard
-            print("Error: No audio content was retrieved to save.")
-            return False
+            print("Error: No audio content was retrieved.")
+            return None
+
+        store_cached_bytes(MUSIC_CACHE_DIR, cache_key, audio_content)
+        return audio_content
 
     except requests.exceptions.Timeout:
         print(f"Error: Fal.ai API request timed out after {API_REQUEST_TIMEOUT_SECONDS} seconds.")
-        return False
+        return None
     except requests.exceptions.HTTPError as http_err:
         print(f"Error: Fal.ai API returned HTTP error: {http_err}")
         try:
             print(f"API error details: {response.text}") # Show error from API if possible
         except Exception:
             pass # Ignore errors reading the error response body
-        return False
+        return None
     except requests.exceptions.RequestException as req_err:
         print(f"Error: Failed to connect to Fal.ai API at {FAL_API_URL}. Error: {req_err}")
-        return False
+        return None
     except json.JSONDecodeError as json_err:
         print(f"Error: Failed to parse JSON response from Fal.ai API. Error: {json_err}")
         try:
             print(f"Received non-JSON response: {response.text}")
         except Exception:
             pass
-        return False
+        return None
     except Exception as e:
         print(f"An unexpected error occurred during music generation: {e}")
+        return None
+    finally:
+        _REQUEST_SLOTS.release()
+
+def generate_and_save_music(
+    prompt: str,
+    duration_seconds: int,
+    output_filepath: str
+) -> bool:
+    """
+    Generates music using the Fal.ai Stable Audio API and saves it locally.
+
+    Args:
+        prompt: Text description of the music to generate.
+        duration_seconds: Desired duration of the music in seconds.
+        output_filepath: Full path (including directory and filename with extension,
+                         e.g., 'output/music/intro_bgm.wav') to save the audio.
+
+    Returns:
+        True if music generation and saving were successful, False otherwise.
+    """
+    audio_content = generate_music(prompt, duration_seconds)
+    if audio_content is None:
+        return False
+
+    print(f"Saving audio to: {output_filepath}")
+    try:
+        # Ensure the output directory exists
+        output_dir = os.path.dirname(output_filepath)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+
+        with open(output_filepath, 'wb') as f:
+            f.write(audio_content)
+
+        print(f"Successfully saved music audio to {output_filepath}")
+        return True
+    except OSError as os_err:
+        print(f"Error: Failed to write audio file to {output_filepath}. Error: {os_err}")
         return False
 
 
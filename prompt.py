@@ -1,76 +1,43 @@
 import dataclasses
+import functools
+import hashlib
 import json
-from typing import Optional, Dict, Any
-
-@dataclasses.dataclass
-class AudioScriptInput:
-    """Represents input for creating music and SFX for dialogue scripts"""
-    script: str                      # The dialogue script with track divisions
-    quiz_theme: Optional[str] = None # Optional theme (e.g., "Solar System")
-    mood: Optional[str] = None       # Optional mood (e.g., "Playful")
-    target_age: Optional[str] = None # Optional target age (e.g., "Children")
-
-def create_music_gen_prompt(input_data: AudioScriptInput) -> Dict[str, Any]:
-    """
-    Generates a structured prompt request for creating music and SFX
-    for dialogue scripts, suitable for an AI model.
-
-    Args:
-        input_data: An AudioScriptInput object containing the script and
-                    optional theme, mood, and target age.
-
-    Returns:
-        A dictionary containing the 'system_prompt', 'prompt' (user message),
-        and 'json_out_example' (description of expected JSON format).
-    """
-    # Set default values if not specified
-    quiz_theme = input_data.quiz_theme or "Educational Quiz"
-    mood = input_data.mood or "Playful and Engaging"
-    target_age = input_data.target_age or "Children"
-
-    # Build the complete user prompt
-    # Use triple quotes for multi-line f-string
-    complete_prompt = f"""
-# Music and Sound Effects Generation for Educational Audio Quiz
-
-## Script:
-{input_data.script}
-
-## Quiz Theme: {quiz_theme}
-## Overall Mood: {mood}
-## Target Audience: {target_age}
-
-Create appropriate music and sound effects descriptions for each track in this audio quiz script. The music should enhance the educational experience while keeping the listeners engaged. Generate the response following the JSON structure provided in the system instructions.
-"""
-
-    # Define the expected JSON output format description (for context, primarily used in system prompt)
-    # Using raw triple quotes r"""...""" helps avoid issues with backslashes if any were present
-    json_out_example = r"""{
-  "overall_bgm": "DESCRIPTION OF CONSISTENT BACKGROUND MUSIC THAT PLAYS THROUGHOUT THE ENTIRE QUIZ. JUST EXPLAIN THE MUSIC, THE BEAT, INSTRUMENTS AND MOOD",
-  "script": [
-     [
-        {
-          "dialogue": "DIALOGUE TEXT FOR TTS",
-          "music": "DESCRIPTION OF BACKGROUND MUSIC/SFX THAT PLAYS DURING THIS DIALOGUE"
-        },
-        {
-          "music": "DESCRIPTION OF STANDALONE MUSIC OR SFX",
-          "duration": INTEGER_DURATION_IN_SECONDS
-        }
-    ],
-
-    [
-        {
-          "music": "DESCRIPTION OF STANDALONE MUSIC OR SFX",
-          "duration": INTEGER_DURATION_IN_SECONDS
-        }
+import sys
+from typing import Optional, Dict, Any, List, NamedTuple, Tuple
+
+# Bump when the static prompt text below changes, so prompt cache keys follow it
+PROMPT_VERSION = "v2"
+
+# --- Static Prompt Text ---
+# Neither block depends on the input, so both are built once at import and every
+# prompt request shares the same string objects
+
+# Example of the expected JSON output. Built from a dict so it is always valid JSON
+# with the same layout, and serialized once at import
+_SCHEMA_EXAMPLE = {
+    "overall_bgm": "DESCRIPTION OF CONSISTENT BACKGROUND MUSIC THAT PLAYS THROUGHOUT THE ENTIRE QUIZ. JUST EXPLAIN THE MUSIC, THE BEAT, INSTRUMENTS AND MOOD",
+    "script": [
+        [
+            {
+                "dialogue": "DIALOGUE TEXT FOR TTS",
+                "music": "DESCRIPTION OF BACKGROUND MUSIC/SFX THAT PLAYS DURING THIS DIALOGUE"
+            },
+            {
+                "music": "DESCRIPTION OF STANDALONE MUSIC OR SFX",
+                "duration": 5 # Integer duration in seconds
+            }
+        ],
+        [
+            {
+                "music": "DESCRIPTION OF STANDALONE MUSIC OR SFX",
+                "duration": 5
+            }
+        ]
     ]
-  ]
-}"""
+}
+_JSON_OUT_EXAMPLE = json.dumps(_SCHEMA_EXAMPLE, indent=2)
 
-    # Define the system prompt
-    # Using raw triple quotes r"""..."""
-    system_prompt = r"""You are an expert audio designer specializing in creating music and sound effects for educational audio content.
+_SYSTEM_PROMPT_HEADER = r"""You are an expert audio designer specializing in creating music and sound effects for educational audio content.
 
 Your task is to create appropriate music and sound effect descriptions for an audio quiz script based on the user's input. Follow these guidelines precisely:
 
@@ -97,28 +64,137 @@ Your task is to create appropriate music and sound effect descriptions for an au
 4.  **Output Format:**
     *   You MUST reply ONLY with a valid JSON object.
     *   Do not include any explanatory text before or after the JSON object.
-    *   The JSON object must strictly adhere to the structure exemplified below:
-        ```json
-        {
-          "overall_bgm": "DESCRIPTION",
-          "script": [
-             [ {"dialogue": "TEXT", "music": "DESC"}, {"music": "DESC", "duration": N (mandtory)} ],
-             [ {"music": "DESC", "duration": N} ]
-          ]
-        }
-
-        THE DURATION IS MANDATORY IF YOU HAVE JUST THE MUSIC FIELD AS ELEMENT
-        
-        ```
-
-REPLY ONLY AS A VALID JSON OBJECT.
+    *   The JSON object must strictly adhere to the structure of the example output below.
+    *   THE DURATION IS MANDATORY IF YOU HAVE JUST THE MUSIC FIELD AS ELEMENT.
 """
 
-    return {
-        "prompt": complete_prompt,
-        "json_out_example": json_out_example, # Kept for reference, but primary guide is in system prompt
-        "system_prompt": system_prompt,
-    }
+# The example output is part of the system prompt itself, so the model sees the
+# format once, inside the prefix that is identical (and cached) on every request
+_SYSTEM_PROMPT = (
+    _SYSTEM_PROMPT_HEADER
+    + "\nExample output:\n"
+    + _JSON_OUT_EXAMPLE
+    + "\n\nREPLY ONLY AS A VALID JSON OBJECT.\n"
+)
+
+# The system prompt as Anthropic content blocks, with a breakpoint that opts it
+# into prompt caching (OpenAI caches prefixes implicitly and takes the plain
+# string). Anthropic only caches prefixes of at least 1024 tokens (more on some
+# models); the prompt is currently a little under that, so the breakpoint is
+# ignored until the instructions grow.
+_SYSTEM_PROMPT_BLOCKS = (
+    {"type": "text", "text": _SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}},
+)
+
+# Opening of every user prompt. Providers cache the longest identical prefix of a
+# request, so the per-quiz details come after it rather than in the middle
+_PROMPT_PREAMBLE = """
+# Music and Sound Effects Generation for Educational Audio Quiz
+
+Create appropriate music and sound effects descriptions for each track in the audio quiz script below. The music should enhance the educational experience while keeping the listeners engaged. Generate the response following the JSON structure provided in the system instructions.
+"""
+# Full user prompt, filled in with str.format_map. The preamble must not contain
+# braces; values substituted in are never parsed as format fields
+_PROMPT_TEMPLATE = _PROMPT_PREAMBLE + """
+## Quiz Theme: {quiz_theme}
+## Overall Mood: {mood}
+## Target Audience: {target_age}
+
+## Script:
+{script}
+"""
+
+# Slots drop the per-instance __dict__ (smaller instances, faster attribute access).
+# dataclasses only supports them from Python 3.10; older versions use a plain class.
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+@dataclasses.dataclass(frozen=True, **_SLOTS) # Hashable, so prompts can be cached per input
+class AudioScriptInput:
+    """Represents input for creating music and SFX for dialogue scripts"""
+    script: str                      # The dialogue script with track divisions
+    quiz_theme: Optional[str] = None # Optional theme (e.g., "Solar System")
+    mood: Optional[str] = None       # Optional mood (e.g., "Playful")
+    target_age: Optional[str] = None # Optional target age (e.g., "Children")
+
+class PromptBundle(NamedTuple):
+    """The prompts for one audio script request. Immutable, so cached bundles can be shared."""
+    prompt: str                                  # User message with the quiz details
+    json_out_example: str                        # Example of the expected JSON (already part of system_prompt)
+    system_prompt: str                           # Instructions, identical for every request
+    system_prompt_blocks: Tuple[Dict[str, Any], ...] # system_prompt marked for Anthropic prompt caching
+    prompt_cache_key: str                        # Groups requests with the same theme, mood and audience
+
+@functools.lru_cache(maxsize=512)
+def create_music_gen_prompt(input_data: AudioScriptInput) -> PromptBundle:
+    """
+    Generates a structured prompt request for creating music and SFX
+    for dialogue scripts, suitable for an AI model.
+
+    Results are cached per input; the static parts are shared by every bundle.
+
+    Args:
+        input_data: An AudioScriptInput object containing the script and
+                    optional theme, mood, and target age.
+
+    Returns:
+        A PromptBundle with the 'prompt' (user message), 'json_out_example',
+        'system_prompt', 'system_prompt_blocks' and 'prompt_cache_key'.
+    """
+    # Only the user prompt is built per call; the rest are module-level constants
+    return _build_prompt_bundle(input_data)
+
+def create_music_gen_prompts_batch(inputs: List[AudioScriptInput]) -> List[PromptBundle]:
+    """
+    Generates prompt requests for many scripts at once, e.g. for
+    get_audio_script_json_batch.
+
+    Unlike create_music_gen_prompt the results are not cached, so a large
+    one-off run doesn't evict the prompts of interactive use.
+
+    Args:
+        inputs: The AudioScriptInput objects to build prompts for.
+
+    Returns:
+        One PromptBundle per input, in order.
+    """
+    return [_build_prompt_bundle(input_data) for input_data in inputs]
+
+def _canonicalize_script(script: str) -> str:
+    """
+    Normalizes formatting differences that don't change the script's meaning.
+
+    Line endings become \n, trailing whitespace is removed from every line and
+    blank lines at the start and end are dropped. Prompt caches (OpenAI's and
+    the local response cache) only match byte-identical text, so scripts that
+    differ only in these ways now share cache entries.
+    """
+    lines = script.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+def _build_prompt_bundle(input_data: AudioScriptInput) -> PromptBundle:
+    """Builds the per-request parts of a prompt; everything else is a module-level constant."""
+    # Set default values if not specified
+    quiz_theme = (input_data.quiz_theme or "").strip() or "Educational Quiz"
+    mood = (input_data.mood or "").strip() or "Playful and Engaging"
+    target_age = (input_data.target_age or "").strip() or "Children"
+
+    # Shared instructions first, then this quiz's details
+    complete_prompt = _PROMPT_TEMPLATE.format_map({
+        "quiz_theme": quiz_theme,
+        "mood": mood,
+        "target_age": target_age,
+        "script": _canonicalize_script(input_data.script),
+    })
+
+    # OpenAI routes requests by prompt_cache_key, so requests sharing it are served
+    # by machines that already hold the prefix. Quizzes with the same details share
+    # the longest prefix; the version changes whenever the static prompt text does.
+    cache_key_data = f"{quiz_theme}|{mood}|{target_age}|{PROMPT_VERSION}".encode("utf-8")
+    prompt_cache_key = hashlib.blake2b(cache_key_data, digest_size=16).hexdigest()
+
+    return PromptBundle(
+        complete_prompt, _JSON_OUT_EXAMPLE, _SYSTEM_PROMPT, _SYSTEM_PROMPT_BLOCKS, prompt_cache_key
+    )
 
 # --- Example Usage ---
 if __name__ == "__main__":
@@ -144,8 +220,8 @@ track_4:
     prompt_request = create_music_gen_prompt(input_data)
 
     print("--- System Prompt ---")
-    print(prompt_request["system_prompt"])
+    print(prompt_request.system_prompt)
     print("\n--- User Prompt (Message) ---")
-    print(prompt_request["prompt"])
+    print(prompt_request.prompt)
     print("\n--- Example JSON Structure (for reference) ---")
-    print(prompt_request["json_out_example"])
\ No newline at end of file
+    print(prompt_request.json_out_example)
\ No newline at end of file
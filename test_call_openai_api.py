@@ -0,0 +1,49 @@
+import json
+import unittest
+
+from call_openai_api import _ScriptTrackScanner
+
+# Strings full of JSON punctuation, escaped quotes and a decoy "script" key
+RESPONSE = json.dumps({
+    "overall_bgm": "Calm \"lo-fi\" beat, no [drums] or {claps}, \\ \"script\": [",
+    "script": [
+        [
+            {"dialogue": "He said \"[hi]\", then left}", "music": "Soft \"pad\" ]"},
+            {"music": "Drum roll, \\\"]}", "duration": 3}
+        ],
+        [{"music": "Chime {ding}", "duration": 1}]
+    ]
+}, indent=2)
+
+
+def feed_in_chunks(text, size):
+    """Feeds `text` to a new scanner `size` characters at a time and collects the tracks."""
+    scanner = _ScriptTrackScanner()
+    tracks = []
+    for start in range(0, len(text), size):
+        tracks.extend(scanner.feed(text[start:start + size]))
+    return tracks
+
+
+class ScriptTrackScannerTest(unittest.TestCase):
+
+    def test_chunked_feed_matches_parsed_tracks(self):
+        expected = list(enumerate(json.loads(RESPONSE)["script"]))
+        for size in (1, 2, 3, 7, 64, len(RESPONSE)):
+            with self.subTest(chunk_size=size):
+                self.assertEqual(feed_in_chunks(RESPONSE, size), expected)
+
+    def test_scalar_elements_keep_indices_aligned(self):
+        response = '{"script": ["x", 5, [{"music": "a", "duration": 1}], null, {"music": "b"}]}'
+        self.assertEqual(
+            feed_in_chunks(response, 1),
+            [(2, [{"music": "a", "duration": 1}]), (4, {"music": "b"})]
+        )
+
+    def test_arrays_outside_script_are_ignored(self):
+        response = '{"other": [[1], [2]], "script": [[{"music": "a"}]]}'
+        self.assertEqual(feed_in_chunks(response, 5), [(0, [{"music": "a"}])])
+
+
+if __name__ == "__main__":
+    unittest.main()